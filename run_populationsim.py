@@ -1,14 +1,23 @@
 # ActivitySim
 # See full license in LICENSE.txt.
 
+import os
 import sys
 import argparse
+import logging
 
 from activitysim.core.config import setting
-from activitysim.core import inject
+from activitysim.core import inject, config
 
 from activitysim.cli.run import add_run_args, run
 from populationsim import steps
+from populationsim.steps import setup_data_structures
+
+from setup_inputs import incidence
+
+logger = logging.getLogger(__name__)
+
+build_incidence_table = setup_data_structures.build_incidence_table
 
 
 @inject.injectable()
@@ -28,10 +37,35 @@ def log_settings():
     ]
 
 
+def cached_incidence_table(control_spec, households_df, persons_df, crosswalk_df):
+    """
+    Uses the incidence table saved with the seeds by setup_inputs if it was built from the
+    same seed files and controls, otherwise builds it as usual.
+    """
+    seed_files = {x['tablename']: x['filename'] for x in setting('input_table_list')}
+    seed_paths = [config.data_file_path(seed_files[x]) for x in ['households', 'persons']]
+    controls_path = config.config_file_path(setting('control_file_name', 'controls.csv'))
+
+    key = incidence.incidence_key(seed_paths, controls_path)
+    incidence_path = os.path.join(os.path.dirname(seed_paths[0]), incidence.INCIDENCE_FILE)
+    incidence_table = incidence.read_incidence(incidence_path, key)
+
+    # households_df is already filtered to the seed zones, so only its rows are kept
+    if incidence_table is not None \
+            and incidence_table.columns.to_list() == control_spec.target.to_list() \
+            and households_df.index.isin(incidence_table.index).all():
+        logger.info('Using cached incidence table %s' % incidence_path)
+        return incidence_table.reindex(households_df.index)
+
+    return build_incidence_table(control_spec, households_df, persons_df, crosswalk_df)
+
+
 if __name__ == '__main__':
 
     assert inject.get_injectable('preload_injectables', None)
 
+    setup_data_structures.build_incidence_table = cached_incidence_table
+
     parser = argparse.ArgumentParser()
     add_run_args(parser)
     args = parser.parse_args()
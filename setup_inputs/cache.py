@@ -0,0 +1,616 @@
+"""
+The raw ACS and PUMS data are cached as hive-partitioned parquet datasets, e.g.,
+    raw/acs_data/year=2021/acs_type=acs5/geo=BG/state=01/data.parquet
+so that adding a state only writes that state's partition, and readers can load
+just the states they need.
+
+A JSON manifest next to the partitions records the columns, row count, source URL
+and content hash of each partition, so checking what is missing is a metadata lookup.
+"""
+import os
+import json
+import time
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from setup_inputs import settings
+from setup_inputs.utils import encode_pums_keys, pid_alive, file_hash
+
+PARTITION_FILE = 'data.parquet'
+MANIFEST_FILE = 'manifest.json'
+_MANIFEST_LOCK = threading.Lock()
+
+
+def state_code(state: int | str) -> str:
+    """
+    Formats a state FIPS code as a two-digit string partition key.
+
+    Args:
+        state (int | str): The state FIPS code, e.g., 1 or '01'.
+
+    Returns:
+        str: The two-digit state FIPS code.
+    """
+    return str(int(state)).zfill(2)
+
+def dataset_dir(prefix: str, geo: str, year: int | None = None, acs_type: str | None = None) -> str:
+    """
+    Returns the directory of the partitioned dataset for a geography.
+
+    Args:
+        prefix (str): The dataset prefix, e.g., settings.ACS_DATA_PREFIX.
+        geo (str): The geography or PUMS level, e.g., 'BG' or 'HH'.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+
+    Returns:
+        str: The dataset directory path.
+    """
+    year = settings.YEAR if year is None else year
+    acs_type = settings.ACS_TYPE if acs_type is None else acs_type
+
+    return os.path.join(settings.RAW_DATA_DIR, prefix, f'year={year}', f'acs_type={acs_type}', f'geo={geo}')
+
+def partition_path(prefix: str, geo: str, state: int | str, year: int | None = None, acs_type: str | None = None) -> str:
+    """
+    Returns the parquet file path of a single state partition.
+
+    Args:
+        prefix (str): The dataset prefix.
+        geo (str): The geography or PUMS level.
+        state (int | str): The state FIPS code.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+
+    Returns:
+        str: The partition file path.
+    """
+    return os.path.join(dataset_dir(prefix, geo, year, acs_type), f'state={state_code(state)}', PARTITION_FILE)
+
+def partition_key(prefix: str, geo: str, state: int | str, year: int | None = None, acs_type: str | None = None) -> str:
+    """
+    Returns the manifest key of a partition, its directory relative to the raw data directory.
+
+    Args:
+        prefix (str): The dataset prefix.
+        geo (str): The geography or PUMS level.
+        state (int | str): The state FIPS code.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+
+    Returns:
+        str: The manifest key.
+    """
+    path = os.path.dirname(partition_path(prefix, geo, state, year, acs_type))
+
+    return os.path.relpath(path, settings.RAW_DATA_DIR).replace(os.sep, '/')
+
+def read_manifest() -> dict:
+    """
+    Reads the cache manifest, rebuilding it from the partition metadata if it does not exist yet.
+
+    Returns:
+        dict: The manifest entries keyed by partition key.
+    """
+    path = os.path.join(settings.RAW_DATA_DIR, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return rebuild_manifest()
+
+    with open(path) as f:
+        return json.load(f)
+
+def write_manifest(manifest: dict) -> None:
+    """
+    Writes the cache manifest atomically.
+
+    Args:
+        manifest (dict): The manifest entries keyed by partition key.
+    """
+    path = os.path.join(settings.RAW_DATA_DIR, MANIFEST_FILE)
+    os.makedirs(settings.RAW_DATA_DIR, exist_ok=True)
+
+    # Unique temporary file, as several processes may rebuild a missing manifest at once
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def manifest_lock(timeout: float = 60):
+    """
+    Serializes manifest updates across threads and worker processes using a lock file.
+    The lock file holds the holder's PID and a unique token. A waiter only removes it once that process has exited,
+    e.g., crashed, and the holder only removes it while it still holds its own token.
+
+    Args:
+        timeout (float, optional): Seconds after which a lock file without a readable holder, e.g., written by an
+            older version, is considered stale. Defaults to 60.
+    """
+    lock_path = os.path.join(settings.RAW_DATA_DIR, MANIFEST_FILE + '.lock')
+    os.makedirs(settings.RAW_DATA_DIR, exist_ok=True)
+    token = f'{os.getpid()} {uuid.uuid4().hex}'
+    
+    with _MANIFEST_LOCK:
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, token.encode('utf-8'))
+                os.close(fd)
+                break
+            except FileExistsError:
+                remove_stale_lock(lock_path, timeout)
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if read_lock(lock_path) == token:
+                os.remove(lock_path)
+
+def read_lock(lock_path: str) -> str | None:
+    """
+    Reads the holder token of a lock file.
+
+    Args:
+        lock_path (str): The lock file path.
+
+    Returns:
+        str | None: The token, or None if there is no lock file.
+    """
+    try:
+        with open(lock_path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def remove_stale_lock(lock_path: str, timeout: float) -> None:
+    """
+    Removes a lock file whose holder process has exited. A lock file without a holder PID is only removed once
+    it is older than the timeout, as it may have just been created and not yet written.
+
+    Args:
+        lock_path (str): The lock file path.
+        timeout (float): Seconds after which a lock file without a holder PID is considered stale.
+    """
+    token = read_lock(lock_path)
+    if token is None:
+        return
+    
+    pid = token.split(' ')[0]
+    if pid.isdigit():
+        stale = not pid_alive(int(pid))
+    else:
+        try:
+            stale = time.time() - os.path.getmtime(lock_path) > timeout
+        except FileNotFoundError:
+            return
+    
+    # Re-read so a lock taken over by a live process in the meantime is kept
+    if stale and read_lock(lock_path) == token:
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+def update_manifest(entries: dict) -> None:
+    """
+    Adds or replaces manifest entries.
+
+    Args:
+        entries (dict): The manifest entries keyed by partition key.
+    """
+    with manifest_lock():
+        manifest = read_manifest()
+        manifest.update(entries)
+        write_manifest(manifest)
+
+def manifest_entry(fpath: str, source: str | list | None = None) -> dict:
+    """
+    Creates the manifest entry of a partition file from its parquet metadata.
+
+    Args:
+        fpath (str): The partition file path.
+        source (str | list | None, optional): The URL(s) the data was fetched from. Defaults to None.
+
+    Returns:
+        dict: The manifest entry.
+    """
+    metadata = pq.read_metadata(fpath)
+    columns = [x for x in metadata.schema.to_arrow_schema().names if not x.startswith('__index_level_')]
+
+    return {
+        'columns': columns,
+        'rows': metadata.num_rows,
+        'source': source,
+        'sha256': file_hash(fpath),
+        'updated': datetime.now().isoformat(timespec='seconds'),
+    }
+
+def rebuild_manifest() -> dict:
+    """
+    Rebuilds the manifest by scanning the partition files on disk, e.g., for caches written before
+    the manifest existed. Sources are unknown for rebuilt entries.
+
+    Returns:
+        dict: The manifest entries keyed by partition key.
+    """
+    manifest = {}
+    if os.path.exists(settings.RAW_DATA_DIR):
+        for root, _, files in os.walk(settings.RAW_DATA_DIR):
+            if PARTITION_FILE in files and os.path.basename(root).startswith('state='):
+                key = os.path.relpath(root, settings.RAW_DATA_DIR).replace(os.sep, '/')
+                manifest[key] = manifest_entry(os.path.join(root, PARTITION_FILE))
+
+    if len(manifest) > 0:
+        print(f'Rebuilt cache manifest for {len(manifest)} partitions')
+    write_manifest(manifest)
+
+    return manifest
+
+def cached_states(prefix: str, geo: str, year: int | None = None, acs_type: str | None = None, manifest: dict | None = None) -> list:
+    """
+    Lists the states that have a partition in the dataset from the manifest, without reading any data.
+
+    Args:
+        prefix (str): The dataset prefix.
+        geo (str): The geography or PUMS level.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+        manifest (dict | None, optional): The manifest, if already read. Defaults to reading it.
+
+    Returns:
+        list: The sorted two-digit state FIPS codes.
+    """
+    dataset_key = os.path.dirname(partition_key(prefix, geo, '00', year, acs_type)) + '/'
+    manifest = read_manifest() if manifest is None else manifest
+    states = [x[len(dataset_key):].split('=')[1] for x in manifest.keys() if x.startswith(dataset_key)]
+    states = [x for x in states if os.path.exists(partition_path(prefix, geo, x, year, acs_type))]
+
+    return sorted(states)
+
+def cached_columns(prefix: str, geo: str, state: int | str, year: int | None = None, acs_type: str | None = None, manifest: dict | None = None) -> list:
+    """
+    Looks up the column names of a state partition in the manifest, without reading any data.
+
+    Args:
+        prefix (str): The dataset prefix.
+        geo (str): The geography or PUMS level.
+        state (int | str): The state FIPS code.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+        manifest (dict | None, optional): The manifest, if already read. Defaults to reading it.
+
+    Returns:
+        list: The column names, or an empty list if the partition is not in the manifest.
+    """
+    manifest = read_manifest() if manifest is None else manifest
+    entry = manifest.get(partition_key(prefix, geo, state, year, acs_type), {})
+
+    return entry.get('columns', [])
+
+def write_partitions(df: pd.DataFrame, prefix: str, geo: str, state_col: str, year: int | None = None, acs_type: str | None = None, source: str | list | None = None) -> list:
+    """
+    Writes each state in the DataFrame to its own partition, replacing only those partitions,
+    and records them in the manifest. Files are written to a temporary file first and then renamed into place.
+
+    Args:
+        df (pd.DataFrame): The data to write.
+        prefix (str): The dataset prefix.
+        geo (str): The geography or PUMS level.
+        state_col (str): The column holding the state FIPS code, e.g., 'state' or 'ST'.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+        source (str | list | None, optional): The URL(s) the data was fetched from. Defaults to None.
+
+    Returns:
+        list: The two-digit state FIPS codes written.
+    """
+    assert state_col in df.columns, f'State column {state_col} not in data'
+
+    written, entries = [], {}
+    for state, state_df in df.groupby(df[state_col].astype(int), sort=True):
+        state = state_code(state)
+        path = partition_path(prefix, geo, state, year, acs_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        state_df.reset_index(drop=True).to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+        entries[partition_key(prefix, geo, state, year, acs_type)] = manifest_entry(path, source)
+        written.append(state)
+
+    update_manifest(entries)
+
+    return written
+
+def write_partition_batches(batches, prefix: str, geo: str, state: int | str, year: int | None = None, acs_type: str | None = None, source: str | list | None = None) -> int:
+    """
+    Streams DataFrame batches for a single state into its partition, one parquet row group per batch,
+    so the whole state never has to be held in memory. The partition is replaced once all batches are written.
+
+    Args:
+        batches (Iterable[pd.DataFrame]): The batches of data to write, all with the same columns and dtypes.
+        prefix (str): The dataset prefix.
+        geo (str): The geography or PUMS level.
+        state (int | str): The state FIPS code.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+        source (str | list | None, optional): The URL(s) the data was fetched from. Defaults to None.
+
+    Returns:
+        int: The number of rows written.
+    """
+    path = partition_path(prefix, geo, state, year, acs_type)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    writer, rows = None, 0
+    try:
+        for df in batches:
+            if writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                writer = pq.ParquetWriter(path + '.tmp', table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+            rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    assert writer is not None, f'No data to write for {geo} state {state}'
+
+    os.replace(path + '.tmp', path)
+    update_manifest({partition_key(prefix, geo, state, year, acs_type): manifest_entry(path, source)})
+
+    return rows
+
+def join_partitions(df: pd.DataFrame, prefix: str, geo: str, state_col: str, keys: list, year: int | None = None, acs_type: str | None = None, source: str | list | None = None) -> list:
+    """
+    Joins new columns onto the existing state partitions by the key columns and rewrites those partitions,
+    so new fields can be added without re-fetching the cached ones.
+
+    Args:
+        df (pd.DataFrame): The key columns and the new columns to add.
+        prefix (str): The dataset prefix.
+        geo (str): The geography or PUMS level.
+        state_col (str): The column holding the state FIPS code.
+        keys (list): The key columns to join on, e.g., the GEOID parts or SERIALNO/SPORDER.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+        source (str | list | None, optional): The URL(s) the new columns were fetched from. Defaults to None.
+
+    Raises:
+        AssertionError: If the new rows do not match the cached rows one to one.
+
+    Returns:
+        list: The two-digit state FIPS codes written.
+    """
+    assert state_col in df.columns, f'State column {state_col} not in data'
+    assert set(keys).issubset(df.columns), f'Key columns {keys} not in data'
+
+    manifest = read_manifest()
+    written = []
+    for state, state_df in df.groupby(df[state_col].astype(int), sort=True):
+        state = state_code(state)
+        cached = read_partitions(prefix, geo, states=[state], year=year, acs_type=acs_type)
+        new_cols = [x for x in state_df.columns if x not in cached.columns]
+        
+        # Older partitions may hold the keys with another data type, e.g., GEOID parts or SERIALNO as strings
+        if 'SERIALNO' in keys:
+            cached = encode_pums_keys(cached)
+        cached = cached.astype({k: state_df[k].dtype for k in keys if cached[k].dtype != state_df[k].dtype})
+        merged = cached.merge(state_df[keys + new_cols], on=keys, how='left', validate='one_to_one')
+        assert len(merged) == len(cached) and merged[new_cols].notna().all().all(), \
+            f'New columns for state {state} do not match the cached {geo} rows on {keys}'
+        
+        old_source = manifest.get(partition_key(prefix, geo, state, year, acs_type), {}).get('source')
+        sources = [x for x in [old_source, source] if x is not None]
+        sources = [y for x in sources for y in (x if isinstance(x, list) else [x])]
+        
+        write_partitions(merged, prefix, geo, state_col, year, acs_type, source=sources or None)
+        written.append(state)
+
+    return written
+
+def read_partitions(prefix: str, geo: str, states: list | None = None, columns: list | None = None, year: int | None = None, acs_type: str | None = None) -> pd.DataFrame:
+    """
+    Reads the partitioned dataset, filtered to the requested states and columns.
+
+    Args:
+        prefix (str): The dataset prefix.
+        geo (str): The geography or PUMS level.
+        states (list | None, optional): The state FIPS codes to read. Defaults to all cached states.
+        columns (list | None, optional): The columns to read. Defaults to all columns.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+
+    Returns:
+        pd.DataFrame: The data, in state order.
+    """
+    available = cached_states(prefix, geo, year, acs_type)
+    if states is not None:
+        states = set(state_code(x) for x in states)
+        available = [x for x in available if x in states]
+
+    frames = [pd.read_parquet(partition_path(prefix, geo, x, year, acs_type), columns=columns) for x in available]
+    if len(frames) == 0:
+        return pd.DataFrame(columns=columns)
+
+    return pd.concat(frames, axis=0, ignore_index=True)
+
+def migrate_legacy(prefix: str, geo: str, state_col: str, year: int | None = None, acs_type: str | None = None) -> None:
+    """
+    Splits a legacy monolithic {prefix}_{geo}.parquet cache into state partitions, if present,
+    so that existing downloads are not fetched again. The legacy file is kept as {prefix}_{geo}_legacy.parquet.
+
+    Args:
+        prefix (str): The dataset prefix.
+        geo (str): The geography or PUMS level.
+        state_col (str): The column holding the state FIPS code.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+    """
+    legacy_path = os.path.join(settings.RAW_DATA_DIR, f'{prefix}_{geo}.parquet')
+    if not os.path.exists(legacy_path) or len(cached_states(prefix, geo, year, acs_type)) > 0:
+        return
+
+    print(f'Migrating legacy {legacy_path} to partitioned cache')
+    write_partitions(pd.read_parquet(legacy_path), prefix, geo, state_col, year, acs_type, source=legacy_path)
+    os.replace(legacy_path, legacy_path.replace('.parquet', '_legacy.parquet'))
+
+def download_key(fpath: str) -> str:
+    """
+    Returns the manifest key of a downloaded file, its path relative to the raw data directory.
+
+    Args:
+        fpath (str): The downloaded file path.
+
+    Returns:
+        str: The manifest key, e.g., download/csv/2021/acs5/csv_hal.zip.
+    """
+    return 'download/' + os.path.relpath(fpath, settings.RAW_DATA_DIR).replace(os.sep, '/')
+
+def touch_download(fpath: str, ingested: bool | None = None) -> None:
+    """
+    Records that a downloaded zip file was used, for the least-recently-used eviction order.
+
+    Args:
+        fpath (str): The downloaded file path.
+        ingested (bool | None, optional): Whether its contents are now in the parquet cache,
+            which makes it evictable. Defaults to None to keep the current state.
+    """
+    key = download_key(fpath)
+    with manifest_lock():
+        manifest = read_manifest()
+        entry = manifest.get(key, {'ingested': False})
+        entry['last_used'] = time.time()
+        if ingested is not None:
+            entry['ingested'] = ingested
+        manifest[key] = entry
+        write_manifest(manifest)
+
+def cache_kind(fpath: str) -> tuple:
+    """
+    Classifies a raw cache file by kind and vintage from its path.
+
+    Args:
+        fpath (str): The file path.
+
+    Returns:
+        tuple: The kind (e.g., acs_data, csv, shp, geography, http) and the vintage, e.g., 2021/acs5.
+    """
+    parts = os.path.relpath(fpath, settings.RAW_DATA_DIR).replace(os.sep, '/').split('/')
+    kind = parts[0] if len(parts) > 1 else 'other'
+    
+    # Hive style year=, acs_type= and tiger= folders
+    vintage = [x.split('=')[1] for x in parts if x.split('=')[0] in ['year', 'acs_type', 'tiger']]
+    if kind == 'csv' and len(parts) == 4:
+        vintage = parts[1:3]
+    elif kind == 'shp' and parts[-1].startswith('tl_'):
+        vintage = parts[-1].split('_')[1:2]
+    
+    return kind, '/'.join(vintage) or '-'
+
+def cache_files() -> pd.DataFrame:
+    """
+    Lists the raw cache files with their kind, vintage, size, last use and whether they can be evicted.
+    Downloaded zips whose contents were ingested into the parquet cache are evictable, as are the cached
+    HTTP responses in raw/http, which are only refetched when needed again.
+
+    Returns:
+        pd.DataFrame: One row per file.
+    """
+    manifest = read_manifest()
+    
+    rows = []
+    for root, _, files in os.walk(settings.RAW_DATA_DIR):
+        for x in files:
+            fpath = os.path.join(root, x)
+            kind, vintage = cache_kind(fpath)
+            entry = manifest.get(download_key(fpath), {})
+            is_response = kind == 'http' and not x.endswith('.tmp')
+            rows.append({
+                'path': fpath,
+                'kind': kind,
+                'vintage': vintage,
+                'bytes': os.path.getsize(fpath),
+                'last_used': entry.get('last_used', max(os.path.getatime(fpath), os.path.getmtime(fpath))),
+                'evictable': (x.endswith('.zip') and entry.get('ingested', False)) or is_response,
+            })
+    
+    return pd.DataFrame(rows, columns=['path', 'kind', 'vintage', 'bytes', 'last_used', 'evictable'])
+
+def status() -> pd.DataFrame:
+    """
+    Reports the raw cache usage per kind and vintage.
+
+    Returns:
+        pd.DataFrame: The files, total and evictable bytes per kind and vintage.
+    """
+    files = cache_files()
+    files['evictable_bytes'] = files['bytes'].where(files['evictable'], 0)
+    usage = files.groupby(['kind', 'vintage']).agg(files=('path', 'size'), bytes=('bytes', 'sum'), evictable_bytes=('evictable_bytes', 'sum'))
+    
+    budget = settings.RAW_CACHE_BUDGET_BYTES
+    report = usage.assign(**{x: usage[x] / 1024 ** 2 for x in ['bytes', 'evictable_bytes']})
+    print(report.rename(columns={'bytes': 'MB', 'evictable_bytes': 'evictable MB'}).round(1).to_string())
+    print(f'Total {files["bytes"].sum() / 1024 ** 3:.3f} GB' + (f' of {budget / 1024 ** 3:.3f} GB budget' if budget else ''))
+    
+    return usage
+
+def prune(budget: int | None = None, dry_run: bool = False) -> list:
+    """
+    Evicts ingested zip files and cached HTTP responses, least recently used first, until the raw cache fits the byte budget.
+
+    Args:
+        budget (int | None, optional): The byte budget. Defaults to settings.RAW_CACHE_BUDGET_BYTES.
+        dry_run (bool, optional): Whether to only report what would be evicted. Defaults to False.
+
+    Returns:
+        list: The evicted file paths.
+    """
+    budget = settings.RAW_CACHE_BUDGET_BYTES if budget is None else budget
+    if budget is None or not os.path.exists(settings.RAW_DATA_DIR):
+        return []
+    
+    files = cache_files()
+    excess = files['bytes'].sum() - budget
+    if excess <= 0:
+        return []
+    
+    candidates = files[files['evictable']].sort_values('last_used')
+    evict = candidates[candidates['bytes'].cumsum().shift(fill_value=0) < excess]
+    
+    for fpath in evict['path']:
+        print(f'{"Would evict" if dry_run else "Evicting"} {os.path.relpath(fpath, settings.RAW_DATA_DIR)}')
+        if not dry_run:
+            os.remove(fpath)
+    
+    if not dry_run and len(evict) > 0:
+        with manifest_lock():
+            manifest = read_manifest()
+            for fpath in evict['path']:
+                manifest.pop(download_key(fpath), None)
+            write_manifest(manifest)
+    
+    if evict['bytes'].sum() < excess:
+        print(f'Raw cache is still {(excess - evict["bytes"].sum()) / 1024 ** 3:.3f} GB over budget, nothing else can be evicted')
+    
+    return evict['path'].tolist()
+
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Raw cache usage and eviction')
+    parser.add_argument('command', choices=['status', 'prune'])
+    parser.add_argument('--budget', type=float, default=None, help='Byte budget, defaults to settings.RAW_CACHE_BUDGET_BYTES')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    
+    if args.command == 'prune':
+        prune(None if args.budget is None else int(args.budget), dry_run=args.dry_run)
+    status()
@@ -0,0 +1,259 @@
+"""
+A local stand-in for the Census servers, so the fetch paths can be run offline and benchmarked reproducibly.
+
+The server replays recorded fixtures of API JSON, FTP directory listings and zip files under two prefixes:
+    http://localhost:8000/api/...  ->  https://api.census.gov/...
+    http://localhost:8000/ftp/...  ->  https://www2.census.gov/...
+
+In record mode, requests without a fixture are fetched from the real server and saved, so a live run
+through the server records the fixtures for later offline runs. Point setup_inputs at it with
+    CENSUS_API_URL=http://localhost:8000/api
+    CENSUS_FTP_URL=http://localhost:8000/ftp
+
+Usage:
+    python -m setup_inputs.census_server --record
+    python -m setup_inputs.census_server --latency 0.1 --bandwidth 5000000
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+import requests
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from setup_inputs import settings
+from setup_inputs.utils import strip_api_key, reset_session
+
+UPSTREAM = {'api': 'https://api.census.gov', 'ftp': 'https://www2.census.gov'}
+BLOCK_SIZE = 64 * 1024
+
+
+def fixture_path(fixtures_dir: str, path: str) -> str:
+    """
+    Returns the fixture path for a request path, without the extension. The API key is not part of the key.
+
+    Args:
+        fixtures_dir (str): The fixtures directory.
+        path (str): The request path and query, e.g., /api/data/2021/acs/acs5?get=...
+
+    Returns:
+        str: The fixture file path, to which .body and .json are appended.
+    """
+    key = hashlib.sha256(strip_api_key(path).encode('utf-8')).hexdigest()
+
+    return os.path.join(fixtures_dir, key[:2], key)
+
+def read_fixture(fixtures_dir: str, path: str) -> dict | None:
+    """
+    Reads the metadata of a recorded fixture.
+
+    Args:
+        fixtures_dir (str): The fixtures directory.
+        path (str): The request path and query.
+
+    Returns:
+        dict | None: The status, headers and body path of the fixture, or None if not recorded.
+    """
+    fpath = fixture_path(fixtures_dir, path)
+    if not os.path.exists(fpath + '.json') or not os.path.exists(fpath + '.body'):
+        return None
+
+    with open(fpath + '.json') as f:
+        meta = json.load(f)
+    meta['body'] = fpath + '.body'
+
+    return meta
+
+def record_fixture(fixtures_dir: str, path: str) -> dict | None:
+    """
+    Fetches a request from the real Census server and saves it as a fixture.
+    Error responses, e.g., a 429 or 503, are passed through once without being saved.
+
+    Args:
+        fixtures_dir (str): The fixtures directory.
+        path (str): The request path and query, starting with /api or /ftp.
+
+    Returns:
+        dict | None: The fixture metadata, or None if the path has no upstream server.
+            An error response is returned with its body bytes as 'content' rather than a 'body' file.
+    """
+    prefix, _, rest = path.lstrip('/').partition('/')
+    if prefix not in UPSTREAM:
+        return None
+
+    url = f'{UPSTREAM[prefix]}/{rest}'
+    print(f'Recording {strip_api_key(url)}')
+
+    fpath = fixture_path(fixtures_dir, path)
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    tmp = f'{fpath}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    with requests.get(url, stream=True, timeout=settings.HTTP_TIMEOUT) as response:
+        headers = {k: response.headers[k] for k in ['Content-Type', 'ETag', 'Last-Modified'] if k in response.headers}
+        meta = {'url': strip_api_key(url), 'status': response.status_code, 'headers': headers}
+        if not response.ok:
+            print(f'Not recording {response.status_code} response')
+            return {**meta, 'content': response.content}
+
+        with open(tmp, 'wb') as f:
+            for chunk in response.iter_content(BLOCK_SIZE):
+                f.write(chunk)
+
+    os.replace(tmp, fpath + '.body')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, fpath + '.json')
+
+    return read_fixture(fixtures_dir, path)
+
+
+class CensusHandler(BaseHTTPRequestHandler):
+    """
+    Serves recorded fixtures with the configured latency and bandwidth, including
+    ETag/Last-Modified revalidation and Range requests for resumed downloads.
+    """
+    server: 'CensusServer'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:
+        time.sleep(self.server.latency)
+
+        meta = read_fixture(self.server.fixtures_dir, self.path)
+        if meta is None and self.server.record:
+            meta = record_fixture(self.server.fixtures_dir, self.path)
+
+        if meta is None:
+            body = f'No fixture recorded for {strip_api_key(self.path)}'.encode('utf-8')
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # Upstream errors seen while recording are passed through as they are
+        if 'content' in meta:
+            self.send_response(meta['status'])
+            for k, v in meta['headers'].items():
+                self.send_header(k, v)
+            self.send_header('Content-Length', str(len(meta['content'])))
+            self.end_headers()
+            self.wfile.write(meta['content'])
+            return
+
+        headers = meta['headers']
+        size = os.path.getsize(meta['body'])
+
+        # Conditional requests, so the response cache revalidation can be exercised
+        etag, modified = headers.get('ETag'), headers.get('Last-Modified')
+        if meta['status'] == 200 and ((etag and self.headers.get('If-None-Match') == etag) or
+                                      (modified and self.headers.get('If-Modified-Since') == modified)):
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        # Range requests, so interrupted downloads can be resumed
+        start, status = 0, meta['status']
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if match and status == 200:
+            start = int(match.group(1))
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(size - start))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{size - 1}/{size}')
+        self.end_headers()
+
+        with open(meta['body'], 'rb') as f:
+            f.seek(start)
+            while (block := f.read(BLOCK_SIZE)):
+                self.wfile.write(block)
+                if self.server.bandwidth:
+                    time.sleep(len(block) / self.server.bandwidth)
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class CensusServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the fixture settings for the CensusHandler.
+    """
+    daemon_threads = True
+
+    def __init__(self, fixtures_dir: str, port: int = 8000, record: bool = False, latency: float = 0.0,
+                 bandwidth: float | None = None, verbose: bool = False) -> None:
+        self.fixtures_dir = fixtures_dir
+        self.record = record
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.verbose = verbose
+        super().__init__(('127.0.0.1', port), CensusHandler)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+def start_server(fixtures_dir: str | None = None, port: int = 0, record: bool = False, latency: float = 0.0,
+                 bandwidth: float | None = None) -> CensusServer:
+    """
+    Starts the server in a background thread and points settings at it, e.g., for benchmarks.
+    The CENSUS_API_URL and CENSUS_FTP_URL environment variables are set too, so processes started afterwards
+    that import settings afresh, e.g., spawned workers or run_populationsim.py, also use the server.
+    HTTP_POOL_SIZE is moved to the server URLs and the shared HTTP session rebuilt with them.
+
+    Args:
+        fixtures_dir (str | None, optional): The fixtures directory. Defaults to raw/fixtures.
+        port (int, optional): The port, 0 for any free port. Defaults to 0.
+        record (bool, optional): Whether to record missing fixtures from the real servers. Defaults to False.
+        latency (float, optional): Seconds added to every response. Defaults to 0.0.
+        bandwidth (float | None, optional): Bytes per second per response, None for unlimited. Defaults to None.
+
+    Returns:
+        CensusServer: The running server, stop it with shutdown().
+    """
+    fixtures_dir = fixtures_dir or os.path.join(settings.RAW_DATA_DIR, 'fixtures')
+    server = CensusServer(fixtures_dir, port, record, latency, bandwidth)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    for name, url in {'CENSUS_API_URL': f'{server.url}/api', 'CENSUS_FTP_URL': f'{server.url}/ftp'}.items():
+        old_url = getattr(settings, name)
+        if old_url in settings.HTTP_POOL_SIZE:
+            settings.HTTP_POOL_SIZE[url] = settings.HTTP_POOL_SIZE.pop(old_url)
+        setattr(settings, name, url)
+        os.environ[name] = url
+    reset_session()
+
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Census stand-in server')
+    parser.add_argument('--fixtures', type=str, default=os.path.join(settings.RAW_DATA_DIR, 'fixtures'))
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--record', action='store_true', help='Record missing fixtures from the real Census servers')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--bandwidth', type=float, default=None, help='Bytes per second per response')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = CensusServer(args.fixtures, args.port, args.record, args.latency, args.bandwidth, args.verbose)
+    print(f'Serving {"and recording " if args.record else ""}Census fixtures from {args.fixtures}')
+    print(f'Set CENSUS_API_URL={server.url}/api and CENSUS_FTP_URL={server.url}/ftp')
+    server.serve_forever()
@@ -0,0 +1,195 @@
+import ast
+import numpy as np
+import pandas as pd
+
+from setup_inputs import settings
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+def split_terms(expression: str) -> list:
+    """
+    Splits a controls.csv expression into its & terms, normalized so the same term is written the same way
+    in every expression, e.g., '(persons.PWGTP > 0) & (persons.SEX == 1)' -> ['persons.PWGTP > 0', 'persons.SEX == 1'].
+
+    Args:
+        expression (str): The control expression.
+
+    Returns:
+        list: The terms.
+    """
+    terms, stack = [], [ast.parse(expression.strip(), mode='eval').body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitAnd):
+            stack.extend([node.right, node.left])
+        else:
+            terms.append(ast.unparse(node))
+
+    return terms
+
+def compile_controls(controls: pd.DataFrame | None = None) -> dict:
+    """
+    Parses the controls.csv expressions into their terms, grouped by seed table.
+
+    Args:
+        controls (pd.DataFrame | None, optional): The controls with target, seed_table and expression columns. Defaults to settings.PUMS_AGGREGATOR.
+
+    Returns:
+        dict: The seed tables and a dictionary of their targets and terms.
+    """
+    controls = settings.PUMS_AGGREGATOR if controls is None else controls
+
+    compiled = {}
+    for target, table, expression in controls[['target', 'seed_table', 'expression']].itertuples(index=False):
+        compiled.setdefault(table, {})[target] = split_terms(expression)
+
+    return compiled
+
+def numexpr_term(term: str, table: str) -> tuple | None:
+    """
+    Translates a term into a numexpr expression, e.g., 'persons.PWGTP < np.inf' -> 'PWGTP < inf'.
+    Comparisons and boolean operators on table columns and numbers translate, as do isin() of a list of numbers
+    and isna(), e.g., 'persons.SCHG.isin([15, 16])' -> '(SCHG == 15) | (SCHG == 16)'. Other calls do not.
+
+    Args:
+        term (str): The term.
+        table (str): The seed table name used in the term.
+
+    Returns:
+        tuple | None: The numexpr expression and the columns it uses, or None if the term does not translate.
+    """
+    columns = set()
+
+    class Translator(ast.NodeTransformer):
+        def visit_Attribute(self, node):
+            if isinstance(node.value, ast.Name) and node.value.id == table:
+                columns.add(node.attr)
+                return ast.Name(id=node.attr, ctx=ast.Load())
+            if isinstance(node.value, ast.Name) and node.value.id == 'np' and node.attr == 'inf':
+                return ast.Name(id='inf', ctx=ast.Load())
+            raise ValueError(f'Unsupported attribute {ast.unparse(node)}')
+
+        def visit_Call(self, node):
+            func = node.func
+            if not (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Attribute) and not node.keywords):
+                raise ValueError(f'Unsupported call {ast.unparse(node)}')
+            column = self.visit_Attribute(func.value)
+
+            # NaN is the only value not equal to itself
+            if func.attr == 'isna' and not node.args:
+                return ast.Compare(left=column, ops=[ast.NotEq()], comparators=[column])
+
+            if func.attr == 'isin' and len(node.args) == 1 and isinstance(node.args[0], (ast.List, ast.Tuple)):
+                values = node.args[0].elts
+                if len(values) > 0 and all(isinstance(x, ast.Constant) and isinstance(x.value, (int, float)) for x in values):
+                    compares = [ast.Compare(left=column, ops=[ast.Eq()], comparators=[x]) for x in values]
+                    tree = compares[0]
+                    for compare in compares[1:]:
+                        tree = ast.BinOp(left=tree, op=ast.BitOr(), right=compare)
+                    return tree
+
+            raise ValueError(f'Unsupported call {ast.unparse(node)}')
+
+        def generic_visit(self, node):
+            allowed = (ast.Expression, ast.Compare, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Load, ast.cmpop,
+                       ast.BitAnd, ast.BitOr, ast.Invert, ast.USub, ast.Add, ast.Sub, ast.Mult, ast.Div)
+            if not isinstance(node, allowed):
+                raise ValueError(f'Unsupported expression {type(node).__name__}')
+            return super().generic_visit(node)
+
+    try:
+        tree = Translator().visit(ast.parse(term, mode='eval'))
+    except ValueError:
+        return None
+
+    if 'inf' in columns:
+        return None
+
+    return ast.unparse(tree), columns
+
+def evaluate_term(term: str, table: str, df: pd.DataFrame, arrays: dict | None = None) -> np.ndarray:
+    """
+    Evaluates a term over a seed table, with numexpr where it is installed and the term translates,
+    otherwise with eval() over the pandas columns as PopulationSim does.
+
+    Args:
+        term (str): The term.
+        table (str): The seed table name used in the term.
+        df (pd.DataFrame): The seed table.
+        arrays (dict | None, optional): Column arrays already converted for numexpr, reused across terms and added to.
+
+    Returns:
+        np.ndarray: The boolean mask of records.
+    """
+    translated = numexpr_term(term, table) if numexpr is not None else None
+
+    if translated is not None and all(x in df.columns and isinstance(df[x].dtype, np.dtype) and df[x].dtype.kind in 'biuf' for x in translated[1]):
+        expression, columns = translated
+
+        # numexpr has no 8 and 16 bit or unsigned integer types
+        arrays = {} if arrays is None else arrays
+        for col in columns - arrays.keys():
+            values = df[col].to_numpy()
+            if values.dtype.kind == 'u' or (values.dtype.kind == 'i' and values.dtype.itemsize < 4):
+                values = values.astype(np.int64 if values.dtype.itemsize >= 4 else np.int32)
+            arrays[col] = values
+        
+        local_dict = {'inf': np.inf, **{col: arrays[col] for col in columns}}
+
+        return np.asarray(numexpr.evaluate(expression, local_dict=local_dict), dtype=bool)
+
+    return np.asarray(eval(term, {'np': np, 'pd': pd}, {table: df}), dtype=bool)
+
+def incidence_matrix(seeds: dict, controls: pd.DataFrame | None = None) -> dict:
+    """
+    Evaluates all control expressions over the seed tables in one pass. Each distinct term is evaluated once per
+    table, e.g., the '(persons.PWGTP > 0) & (persons.PWGTP < np.inf)' repeated in every person control.
+
+    Args:
+        seeds (dict): The seed tables by name, e.g., {'households': ..., 'persons': ...}.
+        controls (pd.DataFrame | None, optional): The controls. Defaults to settings.PUMS_AGGREGATOR.
+
+    Returns:
+        dict: The seed tables and their incidence, a boolean DataFrame with a column for each target and the seed table's index.
+    """
+    incidence = {}
+    for table, targets in compile_controls(controls).items():
+        assert table in seeds, f'Seed table {table} is missing!'
+        df = seeds[table]
+
+        masks, arrays = {}, {}
+        for terms in targets.values():
+            for term in terms:
+                if term not in masks:
+                    masks[term] = evaluate_term(term, table, df, arrays)
+
+        columns = {target: np.logical_and.reduce([masks[x] for x in terms]) for target, terms in targets.items()}
+        incidence[table] = pd.DataFrame(columns, index=df.index)
+
+    return incidence
+
+def household_incidence(incidence: dict, households_index: pd.Index, controls: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Builds PopulationSim's seed incidence table from the incidence matrix, as its
+    setup_data_structures.build_incidence_table does: a column for each target in the controls order,
+    1/0 for household targets and the count of each household's persons for person targets.
+
+    Args:
+        incidence (dict): The seed tables and their incidence from incidence_matrix, the persons indexed by household_id.
+        households_index (pd.Index): The household_id index of the household seeds.
+        controls (pd.DataFrame | None, optional): The controls. Defaults to settings.PUMS_AGGREGATOR.
+
+    Returns:
+        pd.DataFrame: The incidence table indexed by household_id.
+    """
+    controls = settings.PUMS_AGGREGATOR if controls is None else controls
+
+    counts = {
+        'households': incidence['households'].astype(np.int64),
+        'persons': incidence['persons'].astype(np.int64).groupby(level=0).sum(),
+    }
+
+    return pd.concat(counts.values(), axis=1).reindex(index=households_index, columns=controls.target.to_list())
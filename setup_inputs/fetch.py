@@ -3,36 +3,310 @@ os.environ['DC_STATEHOOD'] = '1'
 import us
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import json
 import zipfile
-from io import BytesIO
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
 
-from setup_inputs import settings
-from setup_inputs.utils import get_with_progress, batched, parse_census_ftp
+from setup_inputs import settings, cache
+from setup_inputs.utils import get_with_progress, download_file, parse_census_ftp, TokenBucket, ThrottledError, AdaptiveSize, run_in_processes, cached_response, StatusError, strip_api_key, encode_pums_keys, cast_dtypes
 
+# Shared across all threads so the caps hold for the whole fetch, not per call
+API_LIMITER = TokenBucket(settings.API_RATE_LIMIT, settings.API_BURST)
+API_SLOTS = threading.BoundedSemaphore(settings.API_MAX_WORKERS)
 
-def api_get(data_type: str, state_fips: int|str|list, geo: str, field_dtypes: dict) -> pd.DataFrame:
+# Columns that identify a row, used to join newly fetched columns onto cached partitions
+JOIN_KEYS = {'ACS': ['state', 'county', 'tract', 'block group'], 'PUMS': ['SERIALNO', 'SPORDER']}
+
+# Geography columns returned by the Census API, parsed as integer GEOID parts
+GEOID_PARTS = ['state', 'county', 'tract', 'block group', 'public use microdata area']
+
+# Fields and states per request, adapted to the measured response times and errors.
+# ACS requests also get NAME and PUMS requests get SERIALNO and SPORDER, which count towards the field limit.
+FIELD_SIZES = {
+    'ACS': AdaptiveSize(settings.API_MAX_FIELDS - 1, 1, settings.API_MAX_FIELDS - 1, settings.API_TARGET_LATENCY),
+    'PUMS': AdaptiveSize(10, 1, settings.API_MAX_FIELDS - 2, settings.API_TARGET_LATENCY),
+}
+# ACS requests list several states in the state: clause, e.g., &in=state:01,02 for BG and TRACT, as the fixed
+# batches of 5 states did. PUMS requests are fetched one state at a time, as they were before.
+STATE_SIZES = {
+    'ACS': AdaptiveSize(5, 1, settings.API_MAX_STATES, settings.API_TARGET_LATENCY),
+    'PUMS': AdaptiveSize(1, 1, 1, settings.API_TARGET_LATENCY),
+}
+
+# Error status codes that may be down to the request size, other client errors (e.g., 400 unknown variable) are not
+SIZE_STATUS_CODES = [413, 414]
+
+
+def api_request(url: str, sizers: tuple = (), raw: bool = False) -> list | bytes:
+    """
+    Fetches a single Census API request, respecting the global concurrency cap and rate limit.
+    If the server throttles the request, all requests are paused with an exponential backoff
+    (or the server's Retry-After) before retrying. Responses are kept in the on-disk response cache
+    for settings.API_CACHE_TTL.
+
+    Args:
+        url (str): The Census API URL to fetch.
+        sizers (tuple, optional): AdaptiveSize controllers to record the response time in. Defaults to ().
+        raw (bool, optional): Whether to return the raw response bytes rather than the parsed JSON. Defaults to False.
+
+    Raises:
+        Exception: If the request is still throttled after the maximum number of retries.
+
+    Returns:
+        list | bytes: The JSON response from the Census API.
+    """
+    
+    # Responses fetched within the TTL are served from the response cache without a request
+    cached = cached_response(url, settings.API_CACHE_TTL, raw)
+    if cached[0] is not None:
+        return cached[0]
+    
+    for attempt in range(settings.API_MAX_RETRIES + 1):
+        API_LIMITER.acquire()
+        try:
+            with API_SLOTS:
+                start = time.monotonic()
+                data = get_with_progress(url, progress=False, raw=raw, cache_ttl=settings.API_CACHE_TTL, cached=cached)
+                for sizer in sizers:
+                    sizer.record(time.monotonic() - start)
+                return data
+        except ThrottledError as e:
+            wait = e.retry_after or settings.API_BACKOFF * (2 ** attempt)
+            print(f'{e.status_code} throttled by the Census API, backing off for {wait}s')
+            API_LIMITER.pause(wait)
+            time.sleep(wait)
+    
+    raise Exception(f'Census API request still throttled after {settings.API_MAX_RETRIES} retries: {url}')
+
+
+def api_url(data_type: str, fields: list, geo_str: str, year: int | None = None, acs_type: str | None = None) -> str:
+    """
+    Builds the Census API URL for a list of fields.
+
+    Args:
+        data_type (str): The data type to fetch. Must be either "PUMS" or "ACS".
+        fields (list): The fields to request.
+        geo_str (str): The for= and in= geography clauses.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+
+    Returns:
+        str: The Census API URL.
+    """
+    year = settings.YEAR if year is None else year
+    acs_type = settings.ACS_TYPE if acs_type is None else acs_type
+    key = settings.CENSUS_API_KEY
+    
+    fields_str = ','.join(fields)
+    if data_type == 'PUMS':
+        return f"{settings.CENSUS_API_URL}/data/{year}/acs/{acs_type}/pums?get={fields_str}{geo_str}&key={key}"
+    
+    return f'{settings.CENSUS_API_URL}/data/{year}/acs/{acs_type}?get=NAME,{fields_str}{geo_str}&key={key}'
+
+def pack_fields(data_type: str, fields: list, key_fields: list, geo_str: str, year: int | None = None, acs_type: str | None = None) -> list:
+    """
+    Packs the fields into as few requests as the current adaptive field count and the URL length allow.
+
+    Args:
+        data_type (str): The data type to fetch. Must be either "PUMS" or "ACS".
+        fields (list): The fields to pack, excluding the key fields.
+        key_fields (list): The fields included in every request.
+        geo_str (str): The for= and in= geography clauses.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+
+    Returns:
+        list: The list of field chunks.
+    """
+    size = FIELD_SIZES[data_type].value
+    
+    chunks = []
+    chunk = []
+    for field in fields:
+        candidate = chunk + [field]
+        too_long = len(api_url(data_type, key_fields + candidate, geo_str, year, acs_type)) > settings.API_MAX_URL_LENGTH
+        if len(chunk) > 0 and (len(chunk) >= size or too_long):
+            chunks.append(chunk)
+            chunk = [field]
+        else:
+            chunk = candidate
+    
+    if len(chunk) > 0 or len(chunks) == 0:
+        chunks.append(chunk)
+    
+    return chunks
+
+def fetch_fields(data_type: str, chunk: list, key_fields: list, geo_str: str, year: int | None = None, acs_type: str | None = None) -> list:
+    """
+    Fetches a chunk of fields. If the request fails in a way that may be down to its size (413/414, server errors,
+    connection errors and timeouts), the request sizes are cut back and the chunk is retried in two halves.
+    Other errors, e.g., a 400 for an unknown variable, are raised at once.
+
+    Args:
+        data_type (str): The data type to fetch. Must be either "PUMS" or "ACS".
+        chunk (list): The fields to fetch, excluding the key fields.
+        key_fields (list): The fields included in every request.
+        geo_str (str): The for= and in= geography clauses.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+
+    Raises:
+        Exception: If a single field request fails.
+
+    Returns:
+        list: A list of (url, raw JSON response) tuples.
+    """
+    url = api_url(data_type, key_fields + chunk, geo_str, year, acs_type)
+    sizers = (FIELD_SIZES[data_type], STATE_SIZES[data_type])
+    
+    try:
+        return [(url, api_request(url, sizers, raw=True))]
+    except Exception as e:
+        # Size, server and connection errors (wrapped by http_get) may be down to the request size
+        size_error = isinstance(e, StatusError) and (e.status_code in SIZE_STATUS_CODES or e.status_code >= 500)
+        if not (size_error or isinstance(e.__cause__, requests.RequestException)):
+            raise
+        
+        for sizer in sizers:
+            sizer.record(None, ok=False)
+        if len(chunk) <= 1:
+            raise
+        
+        half = len(chunk) // 2
+        print(f'Request for {len(chunk)} fields failed ({e}), retrying in two halves')
+        
+        return fetch_fields(data_type, chunk[:half], key_fields, geo_str, year, acs_type) + \
+            fetch_fields(data_type, chunk[half:], key_fields, geo_str, year, acs_type)
+
+def arrow_type(dtype) -> pa.DataType | None:
+    """
+    Maps a field data type from the settings to a pyarrow type.
+
+    Args:
+        dtype: The field data type, e.g., int, 'int' or str.
+
+    Returns:
+        pa.DataType | None: The pyarrow type, or None to let pyarrow infer it.
+    """
+    if dtype in [str, 'str', object]:
+        return pa.string()
+    try:
+        return pa.from_numpy_dtype(np.dtype(dtype))
+    except (TypeError, pa.ArrowNotImplementedError):
+        return None
+
+def parse_api_json(raw: bytes | list, field_dtypes: dict) -> pd.DataFrame:
+    """
+    Parses a Census API JSON response straight into typed columns.
+    The API writes one JSON array per line, so with the brackets stripped each line is a quoted CSV row
+    that pyarrow's CSV reader types while parsing, without creating a Python string for every value.
+    The GEOID part columns (state, county, etc.) are parsed as integers.
+    Falls back to json.loads for responses that do not fit this layout, e.g., with escaped characters.
+
+    Args:
+        raw (bytes | list): The raw response, or an already decoded JSON list of lists.
+        field_dtypes (dict): A dictionary of fields and their data types.
+
+    Returns:
+        pd.DataFrame: The typed data.
+    """
+    dftypes = {k: v for k, v in field_dtypes.items() if arrow_type(v) is not None}
+    
+    if isinstance(raw, bytes) and b'\\' not in raw:
+        column_types = {k: v for k, v in ((k, arrow_type(v)) for k, v in field_dtypes.items()) if v is not None}
+        column_types.update({k: pa.int64() for k in GEOID_PARTS if k not in field_dtypes})
+        
+        csv_bytes = raw.strip().removeprefix(b'[[').removesuffix(b']]').replace(b'],\r\n[', b'\n').replace(b'],\n[', b'\n')
+        parse_options = pacsv.ParseOptions(newlines_in_values=False)
+        convert_options = pacsv.ConvertOptions(column_types=column_types, null_values=['null'], strings_can_be_null=True)
+        try:
+            table = pacsv.read_csv(pa.py_buffer(csv_bytes), parse_options=parse_options, convert_options=convert_options)
+            if all(x.isidentifier() or x in GEOID_PARTS for x in table.column_names):
+                return cast_dtypes(table.to_pandas(), dftypes)
+            print('Falling back to JSON parsing: unexpected Census API response layout')
+        except pa.ArrowInvalid as e:
+            print(f'Falling back to JSON parsing: {e}')
+    
+    data = json.loads(raw) if isinstance(raw, bytes) else raw
+    assert isinstance(data, list) and isinstance(data[0], list), 'Census API returned an error. Check your API key.'
+    
+    df = pd.DataFrame(data[1:], columns=data[0])
+    dftypes = {k: v for k, v in dftypes.items() if k in df.columns}
+    dftypes.update({k: np.int64 for k in GEOID_PARTS if k in df.columns and k not in field_dtypes})
+    
+    # Numbers that overflowed a compact type in the CSV parse land here, so they are caught by the check
+    return cast_dtypes(df, dftypes)
+
+def assemble_chunks(frames: list) -> pd.DataFrame:
+    """
+    Assembles the field chunks of a request into one DataFrame. The columns shared by every chunk
+    (NAME, GEOID parts, SERIALNO/SPORDER) are the row key. Chunks whose keys match the first chunk row
+    for row are concatenated positionally, others are aligned to the first chunk's key index.
+
+    Args:
+        frames (list): The chunk DataFrames.
+
+    Raises:
+        AssertionError: If the chunks share no key columns or do not cover the same rows.
+
+    Returns:
+        pd.DataFrame: The assembled data, in the row order of the first chunk.
+    """
+    assert len(frames) > 0, 'Census API returned an error. Check your API key.'
+    
+    base = frames[0]
+    keys = [x for x in base.columns if all(x in f.columns for f in frames[1:])]
+    assert len(frames) == 1 or len(keys) > 0, f'No columns in common between the chunks to join on, got {[list(f.columns) for f in frames]}'
+    
+    key_index = None
+    columns = [base]
+    for chunk_df in frames[1:]:
+        new_cols = [x for x in chunk_df.columns if x not in keys]
+        
+        # Census returns the rows in the same order for every chunk, so this is usually a plain column concat
+        aligned = len(chunk_df) == len(base) and all(base[k].reset_index(drop=True).equals(chunk_df[k].reset_index(drop=True)) for k in keys)
+        if aligned:
+            columns.append(chunk_df[new_cols].set_axis(base.index))
+            continue
+        
+        if key_index is None:
+            key_index = pd.MultiIndex.from_frame(base[keys])
+            assert key_index.is_unique, f'Key columns {keys} do not uniquely identify the rows'
+        
+        print(f'Chunk rows do not line up on {keys}, aligning by key')
+        chunk_df = chunk_df.set_index(keys)
+        assert len(chunk_df) == len(base) and chunk_df.index.is_unique and key_index.isin(chunk_df.index).all(), \
+            f'Chunks do not cover the same rows on {keys}'
+        columns.append(chunk_df[new_cols].reindex(key_index).set_axis(base.index))
+    
+    return pd.concat(columns, axis=1) if len(columns) > 1 else base
+
+def api_get(data_type: str, state_fips: int|str|list, geo: str, field_dtypes: dict, year: int | None = None, acs_type: str | None = None) -> pd.DataFrame:
     """
     Fetches data from the Census API and returns a pandas DataFrame.
+    The fields are packed into as few requests as the API limits and the adaptive request size allow.
 
     Args:
         data_type (str): The data type to fetch. Must be either "PUMS" or "ACS".
-        state_fips (int): The FIPS code for the state to fetch data for.
-        geo_fields (dict): A dictionary of geographies and their fields.
+        state_fips (int|str|list): The FIPS code, or list of codes, for the states to fetch data for.
+        geo (str): The geography to fetch.
         field_dtypes (dict): A dictionary of fields and their data types.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
 
     Returns:
         pd.DataFrame: The data fetched from the Census API.
     """
     
     assert data_type in ['PUMS', 'ACS'], 'data_type must be either "PUMS" or "ACS"'
-    year = settings.YEAR
-    acs_type = settings.ACS_TYPE  
-    key = settings.CENSUS_API_KEY        
     fields = list(field_dtypes.keys())
     state_fips = ','.join(state_fips) if isinstance(state_fips, list) else state_fips
     
-    # Max field request is 50, so we need to split the fields into chunks of 40
-    chunk_size = 40 if data_type == 'ACS' else 3
     geo_map = {'BG': 'block%20group:*', 'TRACT': 'tract:*', 'COUNTY': 'county:*', 'STATE': f'state:{state_fips}', 'PUMA': 'public%20use%20microdata%20area:*'}
     nested_geo_map = {'BG': 'TRACT', 'TRACT': 'COUNTY', 'COUNTY': 'STATE', 'PUMA': 'STATE', 'STATE': None}
     
@@ -43,119 +317,112 @@ def api_get(data_type: str, state_fips: int|str|list, geo: str, field_dtypes: di
     while next_geo is not None:
         bg_str += f'&in={geo_map[next_geo]}'
         next_geo = nested_geo_map[next_geo]
+    
+    # Assure that SERIALNO or SPORDER are included in PUMS data requests for merging
+    key_fields = [x for x in ['SERIALNO', 'SPORDER'] if x in fields] if data_type == 'PUMS' else []
+    chunks = pack_fields(data_type, [x for x in fields if x not in key_fields], key_fields, bg_str, year, acs_type)
+    
+    # Fetch the field chunks concurrently, map returns them in request order
+    print(f'Fetching {len(fields)} fields in {len(chunks)} requests')
+    with ThreadPoolExecutor(max_workers=settings.API_MAX_WORKERS) as executor:
+        responses = executor.map(lambda chunk: fetch_fields(data_type, chunk, key_fields, bg_str, year, acs_type), chunks)
+        responses = [x for response in responses for x in response]
+    
+    frames = []
+    for url, chunk in responses:
+        assert isinstance(chunk, (bytes, list)) and len(chunk) > 0, 'Census API returned an error. Check your API key.'
+        assert not isinstance(chunk, bytes) or chunk.lstrip().startswith(b'['), \
+            f'Census API returned an error. Check your API key. {chunk[:200]}'
         
-    df = None
-    for i in range(0, len(fields), chunk_size):        
-        to_iter = min(i + chunk_size, len(fields))
-        print(f'Fetching fields {i} to {to_iter} of {len(fields)}')
-        field_chunk = fields[i:i + chunk_size]
-        # Assure that SERIALNO or SPORDER are included in PUMS data requests for merging
-        if data_type == 'PUMS':
-            for x in ['SERIALNO', 'SPORDER']:
-                if x in fields and x not in field_chunk:
-                    field_chunk.append(x)
-        
-        fields_str = ','.join(field_chunk)
-        if data_type == 'PUMS':
-            url = f"https://api.census.gov/data/{year}/acs/{acs_type}/pums?get={fields_str}{bg_str}&key={key}"
-        else:
-            fields_str = 'NAME,' + fields_str
-            url = f'https://api.census.gov/data/{year}/acs/{acs_type}?get={fields_str}{bg_str}&key={key}'
-            
-        # Fetch data from Census API
-        chunk = get_with_progress(url)
-
-        chunkcols = chunk[0]
-        assert isinstance(chunkcols, list), 'Census API returned an error. Check your API key.'
-        
-        chunk_df = pd.DataFrame(chunk[1:], columns=chunkcols)
-        
-        # Join chunks together
-        if df is not None:
-            assert len(set(df.columns).intersection(chunk_df.columns)) > 0, f'No columns in common between {df.columns} and {chunk_df.columns} to join chunks on'
-        # pd.concat([df, chunk_df], axis=1)       )
-        df = chunk_df if df is None else pd.merge(df, chunk_df)
+        # PUMS SERIALNO are encoded as integers, so the chunks line up on int64 keys
+        frames.append(encode_pums_keys(parse_api_json(chunk, field_dtypes)))
+    
+    # Join chunks together
+    df = assemble_chunks(frames)
     
     # Sort columns
     assert isinstance(df, pd.DataFrame), 'Census API returned an error. Check your API key.'
     col_order = list(set(df.columns).difference(fields)) + fields
     df = df[col_order]
     
-    # Confirm that the data types are correct
-    dftypes = {k: field_dtypes[k] for k in df.columns if k in field_dtypes}
-    df = df.astype(dftypes)
+    # Record where the data came from for the cache manifest, without the API key
+    df.attrs['source'] = [strip_api_key(url) for url, _ in responses]
             
     return df
 
-def pqio(data_type: str, state_obj_ls: str, geo_fields: dict, base_path: str, data_dict: dict = {}) -> dict:
+def pqio(data_type: str, geo_states: dict, geo_fields: dict, base_path: str, join: bool = False, year: int | None = None, acs_type: str | None = None) -> None:
     """
-    Fetches data from the Census API and writes it to a parquet file.
+    Fetches data from the Census API and writes each state to its partition of the parquet cache.
 
     Args:
         data_type (str): The data type to fetch. Must be either "PUMS" or "ACS".
-        state_obj_ls (str): The list of state objects to fetch data for.
-        field_dict (dict): A dictionary of fields and their data type to fetch from the Census API.
-        geo_levels (dict): A dictionary of geo levels to fetch data for.
-        path (str): Data path to write parquet file to.
-        data (pd.DataFrame | None, optional): Existing data to append to. Defaults to None.
-
-    Returns:
-        pd.DataFrame: The data fetched from the Census API.
+        geo_states (dict): A dictionary of geo levels and the list of state objects to fetch for each.
+        geo_fields (dict): A dictionary of geo levels and the fields and their data type to fetch from the Census API.
+        base_path (str): The dataset prefix of the parquet cache.
+        join (bool, optional): Whether to join the fetched fields onto the cached partitions by JOIN_KEYS,
+            rather than replacing the partitions. Defaults to False.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
     """
-
-    assert isinstance(data_dict, dict), 'data must be a dictionary'
     
-    for geo, fields in geo_fields.items():
-        batch_size = 5
+    state_col = 'ST' if data_type == 'PUMS' else 'state'
+    
+    for geo, state_obj_ls in geo_states.items():
+        fields = geo_fields[geo]
         geo_str = geo
         
         # If its PUMS data we set geo string to PUMA for the API call but the geo field is HH or PER
         if data_type == 'PUMS':
-            batch_size = 1
             geo_str = 'PUMA'
-            
-        # Create a backup file before opening to prevent data loss
-        for i, state_batch in enumerate(batched(state_obj_ls, batch_size)):
-            # Check if data already exists and get the difference
-            fips = [getattr(state_obj, 'fips') for state_obj in state_batch]
-            ex_fips = getattr(data_dict.get(geo, pd.DataFrame()), 'state', [])
-            fips = list(set(fips).difference(ex_fips))
-            state_name = [getattr(state_obj, 'name') for state_obj in state_batch]
-            
-            if len(fips) > 0:
-                print(f'\nDownloading {geo} {data_type} data for {state_name}, {i * batch_size} of {len(state_obj_ls)}')                
-                    
-                # Fetch data from Census API            
-                df = api_get(data_type, fips, geo_str, fields)
-                
-                # Append to the existing data
-                if data_dict.get(geo) is None:
-                    data_dict[geo] = df
-                else:
-                    # Check if there is an index to match
-                    if data_dict[geo].index.name:
-                        df.set_index(data_dict[geo].index.name, inplace=True)                    
-                    data_dict[geo] = pd.concat([data_dict[geo], df], axis=0)
         
-                # Save updated data
-                path = os.path.join(settings.RAW_DATA_DIR, f'{base_path}_{geo}.parquet')
-                data_dict[geo].to_parquet(path)
-                
-            else:
-                print(f'\nLoading existing {geo} {data_type} data for {state_name}')
+        remaining = sorted(state_obj_ls, key=lambda x: getattr(x, 'fips'))
+        if len(remaining) == 0:
+            continue
+        
+        # Fetch the state batches concurrently, saving each state's partition as its batch arrives.
+        # Batches are cut as workers free up, so later batches follow the adaptive state count.
+        print(f'\nDownloading {geo} {data_type} data for {len(state_obj_ls)} states')
+        n_done = 0
+        with ThreadPoolExecutor(max_workers=settings.API_MAX_WORKERS) as executor:
+            pending = {}
+            while len(remaining) > 0 or len(pending) > 0:
+                while len(remaining) > 0 and len(pending) < settings.API_MAX_WORKERS:
+                    size = STATE_SIZES[data_type].value
+                    state_batch, remaining = remaining[:size], remaining[size:]
+                    fips = [getattr(state_obj, 'fips') for state_obj in state_batch]
+                    pending[executor.submit(api_get, data_type, fips, geo_str, fields, year, acs_type)] = state_batch
                 
-    return data_dict
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    state_batch = pending.pop(future)
+                    df = future.result()
+                    n_done += len(state_batch)
+                    state_name = [getattr(state_obj, 'name') for state_obj in state_batch]
+                    print(f'Downloaded {geo} {data_type} data for {state_name}, {n_done} of {len(state_obj_ls)} states')
+                    
+                    if join:
+                        keys = [x for x in JOIN_KEYS[data_type] if x in df.columns]
+                        cache.join_partitions(df, base_path, geo, state_col, keys, year, acs_type, source=df.attrs.get('source'))
+                    else:
+                        cache.write_partitions(df, base_path, geo, state_col, year, acs_type, source=df.attrs.get('source'))
+        
+        print(f'Request size now {FIELD_SIZES[data_type].value} fields and {STATE_SIZES[data_type].value} states, '
+              f'{FIELD_SIZES[data_type].error_rate():.0%} of requests failed')
 
-def fetch_from_api(data_type: str) -> dict:
+def fetch_from_api(data_type: str, load: bool = True, year: int | None = None, acs_type: str | None = None) -> dict | None:
     
     """
-    Specify PUMS or ACS to fetch Census data from the Census API and returns a pandas DataFrame.
+    Specify PUMS or ACS to fetch Census data from the Census API into the parquet cache.
+    Missing states and columns are found from the cache manifest without loading any data.
     
     Args:
         data_type (str): Type of data to fetch. Must be either "PUMS" or "ACS".
+        load (bool, optional): Whether to load and return the data for settings.FIPS. Defaults to True.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
         
     Returns:
-        pd.DataFrame: Pandas DataFrame of data.
+        dict | None: Dictionary of DataFrames for each geography, or None if not loaded.
     """
     
     data_type = data_type.upper()
@@ -163,197 +430,221 @@ def fetch_from_api(data_type: str) -> dict:
     assert data_type in ['PUMS', 'ACS'], 'data_type must be either "PUMS" or "ACS"'
     assert isinstance(settings.STATES, list), 'settings.STATES must be a list'
     assert isinstance(settings.FIPS, list), 'settings.FIPS must be a list'
-    
-    try:
-        data_dict = globals()[data_type]
-    except:
-        data_dict = {}
         
     fips_list = settings.FIPS
+    year = settings.YEAR if year is None else year
+    acs_type = settings.ACS_TYPE if acs_type is None else acs_type
     
     if data_type == 'PUMS':
-        # geo_fields = {'PUMA': dict(ele for sub in settings.PUMS_FIELDS.values() for ele in sub.items())}
         geo_fields = settings.PUMS_FIELDS
-        base_path = settings.PUMS_DATA_PREFIX                
+        base_path = settings.PUMS_DATA_PREFIX
+        state_col = 'ST'
     else:
         geo_fields = settings.ACS_GEO_FIELDS
         base_path = settings.ACS_DATA_PREFIX
+        state_col = 'state'
     
-    # First check if is already loaded
-    try:
-        has_states, has_columns = [], []                
-        for geo, fields in geo_fields.items():
-            state_fips = data_dict[geo].state.apply(lambda x: x.zfill(2))
-            _has_states = len(set(fips_list).difference(state_fips)) == 0
-            _has_columns = len(set(fields.keys()).difference(data_dict[geo].columns)) == 0
-                
-            has_states.append(_has_states)
-            has_columns.append(_has_columns)
+    # Unversioned legacy caches were written for the configured vintage
+    if year == settings.YEAR and acs_type == settings.ACS_TYPE:
+        for geo in geo_fields.keys():
+            cache.migrate_legacy(base_path, geo, state_col, year, acs_type)
+    
+    # Check which states are missing, these get fetched in full. The manifest is read once for all the lookups.
+    manifest = cache.read_manifest()
+    geo_states = {}
+    stale_fetches = []
+    for geo, fields in geo_fields.items():
+        cached = set(cache.cached_states(base_path, geo, year, acs_type, manifest)).intersection(fips_list)
+        missing_states = set(fips_list).difference(cached)
         
-        if all(has_states + has_columns):
-            return data_dict
-    except:
-        # Then try to load from parquet and check again
-        data_dict = {}
-        # Pass labeled kwargs to avoid misordering
-        kwargs = {
-            'data_type': data_type,
-            'state_obj_ls': set(),
-            'geo_fields': {},
-            'base_path': base_path,
-            'data_dict': data_dict
-        }
+        # Group the cached states by the columns they are missing, only those columns get fetched
+        stale_groups = {}
+        for x in sorted(cached):
+            cached_columns = cache.cached_columns(base_path, geo, x, year, acs_type, manifest)
+            missing_columns = tuple(k for k in fields.keys() if k not in cached_columns)
+            if len(missing_columns) > 0:
+                stale_groups.setdefault(missing_columns, []).append(x)
         
-        # Check if all states and columns are present, otherwise update geo field to kwargs to be fetched
-        for geo, fields in geo_fields.items():
-            fpath = f'{settings.RAW_DATA_DIR}/{base_path}_{geo}.parquet'
-            
-            try:                           
-                data_dict[geo] = pd.read_parquet(fpath)
-                state_fips = data_dict[geo].state.apply(lambda x: x.zfill(2))
-                missing_states = set(fips_list).difference(state_fips)                
-                missing_columns = set(fields.keys()).difference(data_dict[geo].columns)
-                                
-                if len(missing_states) > 0:                    
-                    missing_states = set(us.states.lookup(x) for x in missing_states)
-                    kwargs['state_obj_ls'] = missing_states.union(kwargs['state_obj_ls'])
-                    
-                if len(missing_columns) > 0:                    
-                    missing_field_states = set(us.states.lookup(x) for x in state_fips)                    
-                    kwargs['geo_fields'][geo] = fields
-                    kwargs['state_obj_ls'] = missing_field_states.union(kwargs['state_obj_ls'])
-                    
-                else:
-                    print(f'Loading existing {geo} {data_type} data')
-                    
-            except:
-                # Couldn't read the file, so add geo field to kwargs to be updated
-                print(f'Could not load existing {geo} {data_type} data, fetching')
-                #kwargs['state_obj_ls'] = set(us.states.lookup(x) for x in fips_list)
-                kwargs['state_obj_ls'] = set(us.states.lookup(x) for x in fips_list).union(kwargs.get('state_obj_ls', set()))
-                kwargs['geo_fields'][geo] = fields
-                
-            kwargs['geo_fields'][geo] = fields
-            
-            
-            # Fetch data, appending the parquet data file for each state.
-            if len(kwargs['state_obj_ls']) > 0:
-                print(f'Missing data {geo} {data_type} for {len(kwargs["state_obj_ls"])} states')
-        data_dict = pqio(**kwargs)
+        # PUMS rows are identified by SERIALNO/SPORDER and partitioned by ST, so these are fetched too
+        key_fields = JOIN_KEYS[data_type] + [state_col] if data_type == 'PUMS' else []
+        for missing_columns, stale_states in stale_groups.items():
+            print(f'Missing {geo} {data_type} columns {list(missing_columns)} for {len(stale_states)} states')
+            stale_fields = {k: v for k, v in fields.items() if k in missing_columns or k in key_fields}
+            stale_fetches.append(({geo: [us.states.lookup(x) for x in stale_states]}, {geo: stale_fields}))
         
-    return data_dict
+        if len(missing_states) > 0:
+            print(f'Missing data {geo} {data_type} {year} {acs_type} for {len(missing_states)} states')
+            geo_states[geo] = [us.states.lookup(x) for x in sorted(missing_states)]
+        elif len(stale_groups) == 0:
+            print(f'Loading existing {geo} {data_type} data')
+    
+    # Fetch data, writing the parquet partition for each state
+    pqio(data_type, geo_states, geo_fields, base_path, year=year, acs_type=acs_type)
+    
+    # Fetch only the new columns for cached states and join them onto their partitions
+    for stale_states, stale_fields in stale_fetches:
+        pqio(data_type, stale_states, stale_fields, base_path, join=True, year=year, acs_type=acs_type)
+    
+    # The cached API responses count towards the raw cache budget
+    cache.prune()
+    
+    if not load:
+        return None
+        
+    return load_cache(data_type, fips_list, year, acs_type)
 
-def fetch_pums_from_ftp(year: int = settings.YEAR) -> dict:
+def read_pums_csv(zip_ref: zipfile.ZipFile, file: str, fields: dict):
     """
-    Fetches geography files from the Census FTP server.
+    Streams a PUMS CSV file from a zip archive in record batches using pyarrow's multithreaded CSV reader.
+    NA values are filled with 995, the field data types applied and SERIALNO encoded as int64 keys in each batch.
 
     Args:
-        geo (str): The geography to fetch. Must be one of 'BG', 'TRACT', 'COUNTY', 'STATE', or 'PUMA'.
-        year (int): The year to fetch data for.
+        zip_ref (zipfile.ZipFile): The open zip archive.
+        file (str): The CSV file name within the archive.
+        fields (dict): The fields to read and their data types.
+
+    Yields:
+        pd.DataFrame: The next batch of records.
+    """
+    
+    # Parse numbers as float64 like pandas does for columns with NAs, the NA fill and final dtypes are applied per batch
+    column_types = {k: pa.string() if dtype is str else pa.float64() for k, dtype in fields.items()}
+    
+    read_options = pacsv.ReadOptions(use_threads=True, block_size=settings.PUMS_CSV_BLOCK_SIZE)
+    convert_options = pacsv.ConvertOptions(include_columns=list(fields.keys()), column_types=column_types)
+    
+    with zip_ref.open(file) as f:
+        reader = pacsv.open_csv(f, read_options=read_options, convert_options=convert_options)
+        for batch in reader:
+            yield encode_pums_keys(cast_dtypes(batch.to_pandas().fillna(995), fields))
+
+def ingest_pums_state(geo: str, fips_code: str, fpath: str, zurl: str, fields: dict, join: bool, year: int, acs_type: str) -> str:
+    """
+    Downloads a state's PUMS zip if not cached, and streams it into the state's parquet partition.
+    This is run in a worker process, so it only takes picklable arguments.
+
+    Args:
+        geo (str): The PUMS level, 'HH' or 'PER'.
+        fips_code (str): The state FIPS code.
+        fpath (str): The zip file cache path.
+        zurl (str): The zip file download URL.
+        fields (dict): The fields to read and their data types.
+        join (bool): Whether to join the fields onto the cached partition rather than replacing it.
+        year (int): The data year.
+        acs_type (str): The ACS type.
 
     Returns:
-        gpd.GeoDataFrame: The geography data.
+        str: The state FIPS code.
+    """
+    state_name = getattr(us.states.lookup(fips_code), 'name')
+    
+    if not os.path.exists(fpath):                    
+        print(f'Downloading {state_name} {geo} PUMS data')                
+        download_file(zurl, fpath, progress=False)
+    else:
+        print(f'Loading cached {state_name} {geo} PUMS data')
+    
+    with zipfile.ZipFile(fpath, 'r') as zip_ref:
+        csv_files = [x for x in zip_ref.namelist() if x.endswith('.csv')]
+        if len(csv_files) == 0:
+            raise ValueError(f'Expected .csv file, got {zip_ref.namelist()}')
+        
+        # Stream the record batches, cached states only get the missing columns joined on
+        batches = read_pums_csv(zip_ref, csv_files[-1], fields)
+        if join:
+            df = pd.concat(batches, axis=0, ignore_index=True)
+            cache.join_partitions(df, settings.PUMS_DATA_PREFIX, geo, 'ST', [k for k in JOIN_KEYS['PUMS'] if k in fields], year, acs_type, source=zurl)
+        else:
+            cache.write_partition_batches(batches, settings.PUMS_DATA_PREFIX, geo, fips_code, year, acs_type, source=zurl)
+    
+    # The zip is now only needed again for new columns, so it can be evicted under the cache budget
+    cache.touch_download(fpath, ingested=True)
+    
+    print(f'Finished {state_name} {geo} PUMS data')
+    
+    return fips_code
+
+def fetch_pums_from_ftp(year: int | None = None, load: bool = True, acs_type: str | None = None) -> dict | None:
+    """
+    Fetches PUMS files from the Census FTP server and caches each state as a parquet partition.
+    The zip files are kept per vintage in raw/csv/{year}/{acs_type}, as their names do not include the year.
+
+    Args:
+        year (int | None, optional): The year to fetch data for. Defaults to settings.YEAR.
+        load (bool, optional): Whether to load and return the data for settings.FIPS. Defaults to True.
+        acs_type (str | None, optional): The ACS type, 'acs1' or 'acs5'. Defaults to settings.ACS_TYPE.
+
+    Returns:
+        dict | None: The PUMS data for each level (HH, PER) for the selected states, or None if not loaded.
     """    
     
+    year = settings.YEAR if year is None else year
+    acs_type = settings.ACS_TYPE if acs_type is None else acs_type
+    assert acs_type in settings.ACS_PERIODS, f'Expected acs_type to be one of {list(settings.ACS_PERIODS)}, got {acs_type}'
+    
     geo_fields = settings.PUMS_FIELDS
     base_path = settings.PUMS_DATA_PREFIX  
+    csv_dir = os.path.join(settings.RAW_DATA_DIR, 'csv', str(year), acs_type)
         
-    url = f'https://www2.census.gov/programs-surveys/acs/data/pums/{year}/5-Year/'
-    zips = parse_census_ftp(url, cache_dir=os.path.join(settings.RAW_DATA_DIR, 'csv'), data_type='PUMS')
+    url = f'{settings.CENSUS_FTP_URL}/programs-surveys/acs/data/pums/{year}/{settings.ACS_PERIODS[acs_type]}/'
+    zips = parse_census_ftp(url, cache_dir=csv_dir, data_type='PUMS')
     
     assert isinstance(zips, list), f'Expected list, got {type(zips)}'
     
-    if not os.path.exists(os.path.join(settings.RAW_DATA_DIR, 'csv')):
-        os.mkdir(os.path.join(settings.RAW_DATA_DIR, 'csv'))
+    os.makedirs(csv_dir, exist_ok=True)
+    
+    # Unversioned legacy caches were written for the configured vintage
+    if year == settings.YEAR and acs_type == settings.ACS_TYPE:
+        for geo in geo_fields.keys():
+            cache.migrate_legacy(base_path, geo, 'ST', year, acs_type)
     
-    data_dict = {}
+    manifest = cache.read_manifest()
+    tasks = []
     for geo, fields in geo_fields.items():
+        # Check which states are cached and whether they have all the columns
+        state_list = cache.cached_states(base_path, geo, year, acs_type, manifest)
         
-        # Parquet file path
-        pq_path = f'{settings.RAW_DATA_DIR}/{base_path}_{geo}.parquet'
-        if os.path.exists(pq_path):
-            print(f'Loading existing {geo} PUMS data')
-            df = pd.read_parquet(pq_path)
-        else:
-            df = pd.DataFrame()
-        
-        # Initialize with existing data
-        new_data = [df] 
-        
-        # Check which state column is present
-        state_list = [] 
-        if 'ST' in df.columns:
-            state_list = df['ST'].unique().astype(str)
-            state_list = list(np.char.zfill(state_list, 2))               
+        # Keep only the states we need to add to the parquet cache, and the columns missing from cached states
+        missing_columns = {x: [k for k in fields.keys() if k not in cache.cached_columns(base_path, geo, x, year, acs_type, manifest)] for x in state_list}
+        key_fields = [k for k in JOIN_KEYS['PUMS'] + ['ST'] if k in fields]
         
-        # The selected fields to load
-        usecols = list(fields.keys())
-               
-        # Keep only the states we need to add to the parquet file
-        level_zips = []
-        missing_cols = set(fields.keys()).difference(df.columns)
-        is_missing_cols = len(missing_cols) > 0
-        
-        if is_missing_cols:
-            print(f'Missing PUMS columns {missing_cols}, recreating {geo} PUMS cache data')
-            new_data = []
-            
         for fips_code, fpath, zurl, level in zips:
             is_file = 'csv' in zurl and geo == level.upper()
-            is_missing_state = fips_code in settings.FIPS and fips_code not in state_list            
-            if is_file and (is_missing_state or is_missing_cols):
-                    level_zips.append((fips_code, fpath, zurl, level))
-        
-        # Loop through the states and download/load the data into dataframes 
-        for i, (fips_code, fpath, zurl, level) in enumerate(level_zips, start = 1):        
-            # First check if we need to fetch this state
-            state_obj = us.states.lookup(fips_code)
-            state_name = getattr(state_obj, 'name')
-            
-            if not os.path.exists(fpath):                    
-                print(f'Downloading {state_name} {geo} PUMS data {i} of {len(level_zips)}')                
-                bytes_data = get_with_progress(zurl)
-                assert isinstance(bytes_data, bytes), f'Expected bytes, got {type(bytes_data)}'
-                
-                with open(fpath, 'wb') as f:
-                    f.write(bytes_data)
-                
-                # Pass the bytes data to pandas
-                fpath = BytesIO(bytes_data)
-            else:
-                print(f'Loading cached {state_name} {geo} PUMS data {i} of {len(level_zips)}')
+            if not is_file or fips_code not in settings.FIPS:
+                continue
             
-            with zipfile.ZipFile(fpath, 'r') as zip_ref:
-                for file in zip_ref.namelist():
-                    if file.endswith('.csv'):
-                        assert isinstance(usecols, list), f'Expected list, got {type(usecols)}'                            
-                        df = pd.read_csv(zip_ref.open(file), usecols=usecols, low_memory=False)
-                if df is None:    
-                    raise ValueError(f'Expected .csv file, got {zip_ref.namelist()}')            
-                        
-            # Fill NA values with 995 and enforce data types
-            df = df.fillna(995).astype(fields)
-            
-            new_data.append(df)
-                    
-        if len(new_data) > 1:
-            df = pd.concat(new_data, axis=0)
-            df.to_parquet(path=pq_path)        
-
-        data_dict[geo] = df
+            if fips_code not in state_list:
+                tasks.append((geo, fips_code, fpath, zurl, fields, False, year, acs_type))
+            elif len(missing_columns[fips_code]) > 0:
+                print(f'Missing {geo} PUMS columns {missing_columns[fips_code]} for {fips_code}, adding to cache')
+                usecols = key_fields + missing_columns[fips_code]
+                tasks.append((geo, fips_code, fpath, zurl, {k: fields[k] for k in usecols}, True, year, acs_type))
     
-    return data_dict
+    # Download and ingest the states in parallel, each worker writes its own state partition
+    if len(tasks) > 0:
+        print(f'Ingesting {len(tasks)} PUMS state files')
+        run_in_processes(ingest_pums_state, tasks)
+        cache.prune()
+    
+    if not load:
+        return None
+    
+    return load_cache('PUMS', settings.FIPS, year, acs_type)
 
-def fetch(data_type: str = 'ACS') -> dict:
+def fetch(data_type: str = 'ACS', load: bool = True, year: int | None = None, acs_type: str | None = None) -> dict | None:
     """
-    Fetches data from the Census FTP server.
+    Fetches data from the Census FTP server or API into the parquet cache.
+    Each vintage is cached separately, so a year and ACS type other than the settings can be
+    fetched and loaded side by side without changing the global settings.
 
     Args:
         data_type (str): The data type to fetch. Must be one of 'ACS' or 'PUMS'.
-        year (int): The year to fetch data for.
+        load (bool, optional): Whether to load and return the data for settings.FIPS. Defaults to True.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
 
     Returns:
-        pd.DataFrame: The data.
+        dict | None: Dictionary of DataFrames for each geography, or None if not loaded.
     """
     
     pums_source = settings.PUMS_SOURCE
@@ -363,14 +654,66 @@ def fetch(data_type: str = 'ACS') -> dict:
     
     if data_type == 'PUMS':
         if pums_source == 'ftp':
-            data = fetch_pums_from_ftp(settings.YEAR)
+            data = fetch_pums_from_ftp(year, load=load, acs_type=acs_type)
         else:    
-            data = fetch_from_api(data_type)
+            data = fetch_from_api(data_type, load=load, year=year, acs_type=acs_type)
     else:
-        data = fetch_from_api(data_type)
+        data = fetch_from_api(data_type, load=load, year=year, acs_type=acs_type)
     
     return data
 
+def load_cache(data_type: str, states: list | None = None, year: int | None = None, acs_type: str | None = None) -> dict:
+    """
+    Loads cached data for a set of states from the parquet cache, without fetching anything.
+
+    Args:
+        data_type (str): The data type to load. Must be one of 'ACS' or 'PUMS'.
+        states (list | None, optional): The state FIPS codes to load. Defaults to settings.FIPS.
+        year (int | None, optional): The data year. Defaults to settings.YEAR.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+
+    Returns:
+        dict: Dictionary of DataFrames for each geography.
+    """
+    
+    data_type = data_type.upper()
+    assert data_type in ['ACS', 'PUMS'], f'Expected data_type to be one of "ACS" or "PUMS", got {data_type}'
+    
+    states = settings.FIPS if states is None else states
+    
+    if data_type == 'PUMS':
+        geo_fields, base_path = settings.PUMS_FIELDS, settings.PUMS_DATA_PREFIX
+    else:
+        geo_fields, base_path = settings.ACS_GEO_FIELDS, settings.ACS_DATA_PREFIX
+    
+    data = {geo: cache.read_partitions(base_path, geo, states=states, year=year, acs_type=acs_type) for geo in geo_fields.keys()}
+    
+    # Caches written before the GEOID parts and SERIALNO were parsed as integers hold them as strings,
+    # and older caches hold the fields as int64 rather than their compact types
+    for geo, df in data.items():
+        df = df.astype({k: np.int64 for k in GEOID_PARTS if k in df.columns})
+        data[geo] = encode_pums_keys(cast_dtypes(df, {k: v for k, v in geo_fields[geo].items() if k != 'SERIALNO'}))
+    
+    return data
+
+def load_vintage(data_type: str, year: int, acs_type: str | None = None, states: list | None = None) -> dict:
+    """
+    Loads a specific vintage for a set of states, first fetching any of settings.FIPS not cached
+    for that vintage yet. The global settings are left unchanged.
+
+    Args:
+        data_type (str): The data type to load. Must be one of 'ACS' or 'PUMS'.
+        year (int): The data year.
+        acs_type (str | None, optional): The ACS type. Defaults to settings.ACS_TYPE.
+        states (list | None, optional): The state FIPS codes to load. Defaults to settings.FIPS.
+
+    Returns:
+        dict: Dictionary of DataFrames for each geography.
+    """
+    
+    fetch(data_type.upper(), load=False, year=year, acs_type=acs_type)
+    
+    return load_cache(data_type, states, year, acs_type)
 
 if __name__ == '__main__':
     # Fetch the data and attach to the module    
@@ -1,84 +1,418 @@
 import os
 #os.environ['DC_STATEHOOD'] = '1'
+import numpy as np
 import geopandas as gpd
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from us import states
-from io import BytesIO
 
-from setup_inputs.utils import get_with_progress, parse_census_ftp
-from setup_inputs import settings
+from setup_inputs.utils import download_file, parse_census_ftp, run_in_processes, file_hash
+from setup_inputs import settings, cache
 
-def fetch(geo: str, year: int = settings.YEAR) -> gpd.GeoDataFrame:
+# TIGER attributes used by the crosswalk, without the 10/20 vintage suffix. Only these and the geometry are cached.
+GEO_COLUMNS = {
+    'BG': ['GEOID', 'STATEFP', 'COUNTYFP', 'TRACTCE', 'BLKGRPCE', 'NAMELSAD'],
+    'TRACT': ['GEOID', 'STATEFP', 'COUNTYFP', 'TRACTCE'],
+    'PUMA': ['GEOID', 'STATEFP', 'PUMACE'],
+}
+CENTROID_CRS = '+proj=cea'  # Equal-area projection the centroids and areas are computed in
+
+def strip_vintage(column: str) -> str:
+    """
+    Removes the 10/20 vintage suffix from a TIGER attribute name, e.g., GEOID10 -> GEOID.
     """
-    Fetches geography files from the Census FTP server.
+    return column[:-2] if column[-2:] in ['10', '20'] and column[:-2].isupper() else column
+
+def partition_path(geo: str, state: int | str, year: int | None = None) -> str:
+    """
+    Returns the GeoParquet partition path of a state's geography.
 
     Args:
-        geo (str): The geography to fetch. Must be one of 'BG', 'TRACT', 'COUNTY', 'STATE', or 'PUMA'.
-        year (int): The year to fetch data for.
+        geo (str): The geography, e.g., 'BG'.
+        state (int | str): The state FIPS code.
+        year (int | None, optional): The TIGER vintage. Defaults to settings.TIGER_VINTAGE.
+
+    Returns:
+        str: The partition file path, e.g., raw/geography/tiger=2021/geo=BG/state=01/data.parquet.
+    """
+    year = settings.TIGER_VINTAGE if year is None else year
+
+    return os.path.join(settings.RAW_DATA_DIR, 'geography', f'tiger={year}', f'geo={geo}', f'state={cache.state_code(state)}', cache.PARTITION_FILE)
+
+def cached_states(geo: str, year: int | None = None) -> list:
+    """
+    Lists the states with a cached geography partition.
+
+    Args:
+        geo (str): The geography.
+        year (int | None, optional): The TIGER vintage. Defaults to settings.TIGER_VINTAGE.
+
+    Returns:
+        list: The two-digit state FIPS codes.
+    """
+    geo_dir = os.path.dirname(os.path.dirname(partition_path(geo, '00', year)))
+    if not os.path.exists(geo_dir):
+        return []
+
+    codes = [x.split('=')[1] for x in os.listdir(geo_dir) if x.startswith('state=')]
+
+    return sorted(x for x in codes if os.path.exists(partition_path(geo, x, year)))
+
+def read_shapefile(geo: str, fpath: str) -> gpd.GeoDataFrame:
+    """
+    Reads a TIGER shapefile zip with only the GEO_COLUMNS attributes, using pyogrio's arrow reader if available.
+
+    Args:
+        geo (str): The geography.
+        fpath (str): The zip file path.
+
+    Returns:
+        gpd.GeoDataFrame: The geometries with the vintage suffix removed from the column names.
+    """
+    keep = GEO_COLUMNS.get(geo)
+
+    try:
+        import pyogrio
+        fields = pyogrio.read_info(fpath)['fields']
+        columns = None if keep is None else [x for x in fields if strip_vintage(x) in keep]
+        df = pyogrio.read_dataframe(fpath, columns=columns, use_arrow=True)
+    except ImportError:
+        df = gpd.read_file(fpath)
+        if keep is not None:
+            df = df[[x for x in df.columns if strip_vintage(x) in keep] + ['geometry']]
+
+    return df.rename(columns=strip_vintage)
+
+def add_centroids(df: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Adds the polygon centroids and areas, computed in an equal-area projection.
+
+    Args:
+        df (gpd.GeoDataFrame): The polygons.
+
+    Returns:
+        gpd.GeoDataFrame: The polygons with a 'centroid' point column, in the polygons' CRS, and an 'AREA_M2' column.
+    """
+    projected = df.geometry.to_crs(CENTROID_CRS)
+    df = df.assign(AREA_M2=projected.area.values)
+    df['centroid'] = projected.centroid.to_crs(df.crs).values
+
+    return df
+
+def has_centroids(geo: str, state: int | str, year: int | None = None) -> bool:
+    """
+    Checks whether a cached geography partition has the precomputed centroids, reading only the file footer.
+    """
+    return 'centroid' in pq.read_schema(partition_path(geo, state, year)).names
+
+def partition_key(geo: str, state: int | str, year: int | None = None) -> str | None:
+    """
+    Reads the key a derived partition was built with from its file metadata, reading only the file footer.
+    """
+    metadata = pq.read_schema(partition_path(geo, state, year)).metadata or {}
+    key = metadata.get(b'partition_key')
+
+    return None if key is None else key.decode('utf-8')
+
+def partition_hash(geo: str, state: int | str, year: int | None = None, manifest: dict | None = None) -> str:
+    """
+    Returns the SHA-256 hex digest of a cached partition, from the manifest if it is recorded there.
+
+    Args:
+        geo (str): The geography.
+        state (int | str): The state FIPS code.
+        year (int | None, optional): The TIGER vintage. Defaults to settings.TIGER_VINTAGE.
+        manifest (dict | None, optional): The cache manifest, read once by the caller. Defaults to reading it.
 
     Returns:
-        gpd.GeoDataFrame: The geography data.
-    """    
-    
-    assert isinstance(geo, str), f'Expected str, got {type(geo)}'    
-    
-    url = f'https://www2.census.gov/geo/tiger/TIGER{year}/{geo}/'
-    zips = parse_census_ftp(url, cache_dir=os.path.join(settings.RAW_DATA_DIR, 'shp'), data_type='geography')
-    
-    assert isinstance(zips, list), f'Expected list, got {type(zips)}'
-    
-    if not os.path.exists(os.path.join(settings.RAW_DATA_DIR, 'shp')):
-        os.mkdir(os.path.join(settings.RAW_DATA_DIR, 'shp'))
-    
-    # Parquet file path
-    pq_path = os.path.join(settings.RAW_DATA_DIR, f'geography_{geo}.parquet')
-    if os.path.exists(pq_path):
-        print(f'Loading existing {geo} geography data')
-        geo_df = gpd.read_parquet(pq_path)
+        str: The SHA-256 hex digest.
+    """
+    path = partition_path(geo, state, year)
+    manifest = cache.read_manifest() if manifest is None else manifest
+    entry = manifest.get(os.path.relpath(os.path.dirname(path), settings.RAW_DATA_DIR).replace(os.sep, '/'), {})
+
+    return entry.get('sha256') or file_hash(path)
+
+def write_partition(df: gpd.GeoDataFrame | pd.DataFrame, geo: str, state: int | str, year: int, source: str | None = None,
+                    key: str | None = None) -> None:
+    """
+    Writes a state's geography as a GeoParquet partition and records it in the cache manifest.
+    The centroids and areas are added here, so the crosswalk never reprojects the polygons.
+    Plain DataFrames, e.g., the state's crosswalk, are written as they are.
+
+    Args:
+        df (gpd.GeoDataFrame | pd.DataFrame): The state's geometries.
+        geo (str): The geography.
+        state (int | str): The state FIPS code.
+        year (int): The TIGER vintage.
+        source (str | None, optional): The URL the geometries were fetched from. Defaults to None.
+        key (str | None, optional): The key of the inputs a plain DataFrame was built from, stored in the
+            file metadata and read back with partition_key. Defaults to None.
+    """
+    if isinstance(df, gpd.GeoDataFrame) and 'centroid' not in df.columns:
+        df = add_centroids(df)
+
+    path = partition_path(geo, state, year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    if key is None:
+        df.to_parquet(tmp_path, index=False)
     else:
-        geo_df = gpd.GeoDataFrame()
-    
-    state_col = list(set(['STATEFP', 'STATEFP10']).intersection(geo_df.columns))
-    assert len(state_col) <= 1, f'Expected 1 state column, got {len(state_col)}'
-    if len(state_col) > 0:
-        state_list = geo_df[state_col[0]]        
-        assert isinstance(state_list, pd.Series), f'Expected pd.Series, got {type(state_list)}'
-        state_list = state_list.unique()
+        table = pa.Table.from_pandas(pd.DataFrame(df), preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'partition_key': key.encode('utf-8')})
+        pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+    key = os.path.relpath(os.path.dirname(path), settings.RAW_DATA_DIR).replace(os.sep, '/')
+    cache.update_manifest({key: cache.manifest_entry(path, source)})
+
+def ingest_state_geography(geo: str, fips_code: str, fpath: str, zurl: str, year: int) -> str:
+    """
+    Downloads a state's geography zip if not cached and writes it to the state's GeoParquet partition.
+    This is run in a worker process, so it only takes picklable arguments.
+
+    Args:
+        geo (str): The geography being fetched.
+        fips_code (str): The state FIPS code.
+        fpath (str): The zip file cache path.
+        zurl (str): The zip file download URL.
+        year (int): The TIGER vintage.
+
+    Returns:
+        str: The state FIPS code.
+    """
+    state_name = getattr(states.lookup(fips_code), 'name')
+
+    if not os.path.exists(fpath):
+        print(f'Downloading {state_name} {geo} geography data')
+        download_file(zurl, fpath, progress=False)
     else:
-        state_list = []  
-     
-    new_data = [geo_df]
-    for i, (fips_code, fpath, zurl, level) in enumerate(zips, start = 1):        
-        # First check if we need to fetch this state
-        if fips_code in settings.FIPS and fips_code not in state_list:
-            state_obj = states.lookup(fips_code)
-            state_name = getattr(state_obj, 'name')
-            
-            if not os.path.exists(fpath):
-                print(f'Downloading {state_name} {geo} geography data {i} of {len(zips)}')          
-                bytes_data = get_with_progress(zurl)
-                assert isinstance(bytes_data, bytes), f'Expected bytes, got {type(bytes_data)}'
-                
-                with open(fpath, 'wb') as f:
-                    f.write(bytes_data)
-                    
-                df = gpd.read_file(BytesIO(bytes_data))
-            else:
-                print(f'Loading cached {state_name} {geo} geography data {i} of {len(zips)}')
-                df = gpd.read_file(fpath)
-                
-            new_data.append(df)
-                
-    if len(new_data) > 1:
-        geo_df = pd.concat(new_data, axis=0)
-        geo_df.to_parquet(path=pq_path)
-        
-    names = dict(zip(geo_df.columns, geo_df.columns.str.replace('10|20', '', regex=True)))    
-    geo_df.rename(columns=names, inplace=True)
-    
-    return gpd.GeoDataFrame(geo_df)
+        print(f'Loading cached {state_name} {geo} geography data')
+
+    write_partition(read_shapefile(geo, fpath), geo, fips_code, year, source=zurl)
+
+    # The shapefile zip is ingested, so it can be evicted under the cache budget
+    cache.touch_download(fpath, ingested=True)
+
+    return fips_code
+
+def migrate_legacy(geo: str, year: int) -> None:
+    """
+    Splits a legacy national geography_{geo}.parquet cache into state partitions, if present.
+    The legacy file is kept with a _legacy suffix.
+
+    Args:
+        geo (str): The geography.
+        year (int): The TIGER vintage.
+    """
+    legacy_paths = [os.path.join(settings.RAW_DATA_DIR, 'geography', f'tiger={year}', f'geography_{geo}.parquet')]
+    if year == settings.TIGER_VINTAGE:
+        legacy_paths.append(os.path.join(settings.RAW_DATA_DIR, f'geography_{geo}.parquet'))
+
+    legacy_paths = [x for x in legacy_paths if os.path.exists(x)]
+    if len(legacy_paths) == 0 or len(cached_states(geo, year)) > 0:
+        return
+
+    print(f'Migrating legacy {legacy_paths[0]} to partitioned cache')
+    geo_df = gpd.read_parquet(legacy_paths[0]).rename(columns=strip_vintage)
+    if geo in GEO_COLUMNS:
+        geo_df = geo_df[GEO_COLUMNS[geo] + ['geometry']]
+
+    for state, state_df in geo_df.groupby('STATEFP'):
+        write_partition(state_df, geo, state, year, source=legacy_paths[0])
+    os.replace(legacy_paths[0], legacy_paths[0].replace('.parquet', '_legacy.parquet'))
+
+def read_geography(geo: str, states: list | None = None, year: int | None = None, columns: list | None = None,
+                   geometry: str = 'geometry') -> gpd.GeoDataFrame:
+    """
+    Reads the cached geography partitions of a set of states.
+    With geometry='centroid' only the precomputed centroid points are read, not the polygons.
+
+    Args:
+        geo (str): The geography.
+        states (list | None, optional): The state FIPS codes to read. Defaults to settings.FIPS.
+        year (int | None, optional): The TIGER vintage. Defaults to settings.TIGER_VINTAGE.
+        columns (list | None, optional): The attribute columns to read, the geometry is always read.
+            Defaults to the GEO_COLUMNS and AREA_M2.
+        geometry (str, optional): The geometry to read, 'geometry' for the polygons or 'centroid' for the points,
+            which are returned as the 'geometry' column. Defaults to 'geometry'.
+
+    Returns:
+        gpd.GeoDataFrame: The geography data, in state order.
+    """
+    states = settings.FIPS if states is None else states
+    available = set(cached_states(geo, year))
+    if columns is None:
+        columns = GEO_COLUMNS[geo] + ['AREA_M2'] if geo in GEO_COLUMNS else None
+    columns = None if columns is None else list(columns) + [geometry]
+
+    # partitioning=None, otherwise pyarrow adds the tiger/geo/state directory keys as columns
+    frames = [gpd.read_parquet(partition_path(geo, x, year), columns=columns, partitioning=None) for x in sorted(set(map(cache.state_code, states)) & available)]
+    if len(frames) == 0:
+        return gpd.GeoDataFrame()
+
+    geo_df = gpd.GeoDataFrame(pd.concat(frames, axis=0, ignore_index=True))
+
+    return geo_df.rename_geometry('geometry') if geometry != 'geometry' else geo_df
+
+def read_crosswalk(states: list | None = None, year: int | None = None) -> pd.DataFrame:
+    """
+    Reads the cached spatial crosswalk partitions of a set of states.
+
+    Args:
+        states (list | None, optional): The state FIPS codes to read. Defaults to settings.FIPS.
+        year (int | None, optional): The TIGER vintage. Defaults to settings.TIGER_VINTAGE.
+
+    Returns:
+        pd.DataFrame: The crosswalk, in state order.
+    """
+    states = settings.FIPS if states is None else states
+    available = set(cached_states('XWALK', year))
+
+    frames = [pd.read_parquet(partition_path('XWALK', x, year)) for x in sorted(set(map(cache.state_code, states)) & available)]
+    if len(frames) == 0:
+        return pd.DataFrame()
+
+    return pd.concat(frames, axis=0, ignore_index=True)
+
+def state_trees(polygons: gpd.GeoDataFrame) -> dict:
+    """
+    Projects polygons to each state's UTM zone and builds their STRtree spatial index once,
+    so nearest queries can be repeated and measured in metres.
+
+    Args:
+        polygons (gpd.GeoDataFrame): The polygons, with a STATEFP column.
+
+    Returns:
+        dict: The projected polygons of each state, keyed by STATEFP, with the spatial index built.
+    """
+    trees = {}
+    for state, state_df in polygons.groupby('STATEFP'):
+        projected = state_df.to_crs(state_df.estimate_utm_crs())
+        projected.sindex  # Built here, so every query reuses the same tree
+        trees[state] = projected
+
+    return trees
+
+def nearest_polygons(points: gpd.GeoDataFrame, trees: dict, max_distance: float | None = None) -> pd.DataFrame:
+    """
+    Finds the nearest polygon in the same state for every point, with one spatial index query per state.
+    Ties are broken by polygon order, as with idxmin over the distances.
+
+    Args:
+        points (gpd.GeoDataFrame): The points, with a STATEFP column.
+        trees (dict): The projected polygons of each state, from state_trees.
+        max_distance (float | None, optional): The search radius in metres. Defaults to None, no limit.
+
+    Returns:
+        pd.DataFrame: The 'nearest' polygon index label and the 'distance' in metres of each point, aligned
+            with the points. Points without a polygon in range have a None label and an infinite distance.
+    """
+    nearest = np.full(len(points), None, dtype=object)
+    distance = np.full(len(points), np.inf)
+
+    for state, tree in trees.items():
+        positions = np.flatnonzero(points.STATEFP.values == state)
+        if len(positions) == 0:
+            continue
+
+        projected = points.geometry.iloc[positions].to_crs(tree.crs)
+        (ipoint, ipoly), dist = tree.sindex.nearest(projected, max_distance=max_distance, return_all=False, return_distance=True)
+        nearest[positions[ipoint]] = tree.index.values[ipoly]
+        distance[positions[ipoint]] = dist
+
+    return pd.DataFrame({'nearest': nearest, 'distance': distance}, index=points.index)
+
+def tract_vintage(year: int) -> int:
+    """
+    Returns the decennial census of the tracts and block groups in the ACS of a data year.
+    """
+    return 2020 if year >= 2020 else 2010
+
+def puma_vintage(year: int) -> int:
+    """
+    Returns the decennial census of the PUMAs in the PUMS of a data year, the 2020 PUMAs start with the 2022 PUMS.
+    """
+    return 2020 if year >= 2022 else 2010
+
+def fetch_relationship(vintage: int) -> pd.DataFrame:
+    """
+    Fetches the Census tract to PUMA relationship file of a decennial census, cached in raw/rel.
+
+    Args:
+        vintage (int): The decennial census, 2010 or 2020.
+
+    Returns:
+        pd.DataFrame: The STATEFP, COUNTYFP, TRACTCE and PUMA5CE codes of every tract, as integers.
+    """
+    assert vintage in settings.XWALK_RELATIONSHIP_FILES, f'No tract to PUMA relationship file for {vintage}'
+
+    url = f'{settings.CENSUS_FTP_URL}/{settings.XWALK_RELATIONSHIP_FILES[vintage]}'
+    fpath = os.path.join(settings.RAW_DATA_DIR, 'rel', os.path.basename(url))
+
+    if not os.path.exists(fpath):
+        print(f'Downloading {vintage} tract to PUMA relationship file')
+        download_file(url, fpath, progress=False)
+
+    # utf-8-sig in case the file starts with a byte order mark
+    rel = pd.read_csv(fpath, dtype=str, encoding='utf-8-sig')
+    rel.columns = rel.columns.str.strip()
+
+    return rel[['STATEFP', 'COUNTYFP', 'TRACTCE', 'PUMA5CE']].astype(np.int64)
+
+def fetch(geo: str, year: int | None = None, states: list | None = None, load: bool = True) -> gpd.GeoDataFrame | None:
+    """
+    Fetches geography files from the Census FTP server into the state-partitioned GeoParquet cache.
+    Each TIGER vintage is cached separately in raw/geography/tiger={year}.
+
+    Args:
+        geo (str): The geography to fetch. Must be one of 'BG', 'TRACT', 'COUNTY', 'STATE', or 'PUMA'.
+        year (int | None, optional): The TIGER vintage to fetch. Defaults to settings.TIGER_VINTAGE.
+        states (list | None, optional): The state FIPS codes to load. Defaults to settings.FIPS.
+        load (bool, optional): Whether to load and return the geometries. Defaults to True.
+
+    Returns:
+        gpd.GeoDataFrame | None: The geography data, or None if not loaded.
+    """
+
+    assert isinstance(geo, str), f'Expected str, got {type(geo)}'
+    year = settings.TIGER_VINTAGE if year is None else year
+    states = settings.FIPS if states is None else states
+
+    migrate_legacy(geo, year)
+    missing = set(states).difference(cached_states(geo, year))
+
+    # Backfill the centroids of partitions cached before they were precomputed
+    for state in set(states).difference(missing):
+        if not has_centroids(geo, state, year):
+            print(f'Adding centroids to cached {year} {geo} geography for state {state}')
+            write_partition(gpd.read_parquet(partition_path(geo, state, year), partitioning=None), geo, state, year)
+
+    # Only list the FTP directory if there are states to add
+    if len(missing) > 0:
+        url = f'{settings.CENSUS_FTP_URL}/geo/tiger/TIGER{year}/{geo}/'
+        zips = parse_census_ftp(url, cache_dir=os.path.join(settings.RAW_DATA_DIR, 'shp'), data_type='geography')
+
+        assert isinstance(zips, list), f'Expected list, got {type(zips)}'
+
+        if not os.path.exists(os.path.join(settings.RAW_DATA_DIR, 'shp')):
+            os.mkdir(os.path.join(settings.RAW_DATA_DIR, 'shp'))
+
+        # Read the missing states in parallel, each worker writes its own state partition
+        tasks = [(geo, fips_code, fpath, zurl, year) for fips_code, fpath, zurl, level in zips if fips_code in missing]
+        run_in_processes(ingest_state_geography, tasks)
+        cache.prune()
+    else:
+        print(f'Loading existing {year} {geo} geography data')
+
+    if not load:
+        return None
+
+    return read_geography(geo, states, year)
 
 
 if __name__ == '__main__':
     GEO_BG = fetch('BG')
-    GEO_PUMA = fetch('PUMA')
\ No newline at end of file
+    GEO_PUMA = fetch('PUMA')
@@ -0,0 +1,70 @@
+"""
+The household incidence table cached next to the seed files. This module does not import settings,
+so run_populationsim.py can read the cached table without loading the setup_inputs configuration.
+"""
+import os
+import hashlib
+import json
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+INCIDENCE_FILE = 'incidence_table.parquet'  # Household incidence table cached next to the seed files
+
+def incidence_key(seed_paths: list, controls_path: str) -> str:
+    """
+    Returns the key of an incidence table, a SHA-256 digest of the seed files and controls.csv it was built from.
+
+    Args:
+        seed_paths (list): The household and person seed file paths.
+        controls_path (str): The controls.csv path.
+
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    # Hashed here rather than with utils.file_hash, as utils imports settings
+    digests = []
+    for fpath in list(seed_paths) + [controls_path]:
+        hasher = hashlib.sha256()
+        with open(fpath, 'rb') as f:
+            for block in iter(lambda: f.read(1000000), b''):
+                hasher.update(block)
+        digests.append(hasher.hexdigest())
+
+    return hashlib.sha256(json.dumps(digests).encode('utf-8')).hexdigest()
+
+def write_incidence(incidence_table: pd.DataFrame, fpath: str, key: str) -> None:
+    """
+    Writes an incidence table to parquet with its key in the file metadata, replacing the file atomically.
+
+    Args:
+        incidence_table (pd.DataFrame): The incidence table.
+        fpath (str): The parquet file path.
+        key (str): The incidence key from incidence_key.
+    """
+    table = pa.Table.from_pandas(incidence_table)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'incidence_key': key.encode('utf-8')})
+
+    part_path = fpath + '.part'
+    pq.write_table(table, part_path)
+    os.replace(part_path, fpath)
+
+def read_incidence(fpath: str, key: str) -> pd.DataFrame | None:
+    """
+    Reads a cached incidence table if it was built from the same seed files and controls.
+
+    Args:
+        fpath (str): The parquet file path.
+        key (str): The incidence key of the current seed files and controls from incidence_key.
+
+    Returns:
+        pd.DataFrame | None: The incidence table, or None if there is none or its key does not match.
+    """
+    if not os.path.exists(fpath):
+        return None
+
+    metadata = pq.read_schema(fpath).metadata or {}
+    if metadata.get(b'incidence_key', b'').decode('utf-8') != key:
+        return None
+
+    return pq.read_table(fpath).to_pandas()
@@ -2,36 +2,48 @@ import numpy as np
 import pandas as pd
 import geopandas as gpd
 import os
+import hashlib
+import json
 #os.environ['DC_STATEHOOD'] = '1'
 from itertools import chain
 from us import states
-from setup_inputs import settings, utils, geographies, fetch
+from setup_inputs import settings, utils, geographies, fetch, controls, cache, incidence
 
-ARC_METERS = 111139
+NEAREST_MAX_METERS = 1000  # Furthest a centroid outside every PUMA may be joined to the nearest one
+XWALK_VERSION = 2  # Bump when spatial_crosswalk changes, so the cached state crosswalks are rebuilt
 
 class CreateInputData:
-    def __init__(self, replace: bool = True, verbose: bool = True) -> None:
+    def __init__(self, replace: bool = True, verbose: bool = True, year: int | None = None, acs_type: str | None = None, tiger_vintage: int | None = None) -> None:
                 
         self.FIPS = settings.FIPS
         self.STATES = settings.STATES
         self.replace = replace
         self.verbose = verbose
         
+        # Data vintage, defaults to the settings so several vintages can be prepared in one session
+        self.YEAR = settings.YEAR if year is None else year
+        self.ACS_TYPE = settings.ACS_TYPE if acs_type is None else acs_type
+        self.TIGER_VINTAGE = settings.TIGER_VINTAGE if tiger_vintage is None else tiger_vintage
+        
         self.renames = {
             'ST': 'STATE',
             'BLOCK GROUP': 'BG',
         }
         
-        # Raw data
-        self.ACS_DATA = fetch.fetch('ACS')
-        self.PUMS_DATA = fetch.fetch('PUMS')        
-        self.GEO_BG = geographies.fetch('BG')
-        self.GEO_TRACT = geographies.fetch('TRACT')
-        self.GEO_PUMA = geographies.fetch('PUMA')
+        # Raw data, fetched into the cache here and loaded per batch in create_inputs
+        fetch.fetch('ACS', load=False, year=self.YEAR, acs_type=self.ACS_TYPE)
+        fetch.fetch('PUMS', load=False, year=self.YEAR, acs_type=self.ACS_TYPE)
+        self.ACS_DATA = {}
+        self.PUMS_DATA = {}
+        self.XWALK_SOURCE = self.crosswalk_source()
+        if self.XWALK_SOURCE == 'spatial':
+            for geo in ['BG', 'TRACT', 'PUMA']:
+                geographies.fetch(geo, self.TIGER_VINTAGE, load=False)
         
         # Output variables
         self.ACS_DATA_FINAL = {}
         self.PUMS_DATA_FINAL = {}
+        self.INCIDENCE = {}  # Seed incidence of each controls.csv target, by seed table
         self.XWALK_FINAL = pd.DataFrame()
             
     def create_inputs(self, STATES: list = settings.STATES, data_dir = None):
@@ -57,6 +69,7 @@ class CreateInputData:
         self.ACS_DATA_PATHS['REGION'] = f'{data_dir}/scaled_control_totals_meta.csv'
         self.PUMS_DATA_PATHS = {level: f'{data_dir}/seed_{label_map[level]}.csv' for level in settings.PUMS_FIELDS.keys()}
         self.XWALK_PATH = f'{data_dir}/geo_cross_walk.csv'
+        self.INCIDENCE_PATH = f'{data_dir}/{incidence.INCIDENCE_FILE}'
         
         print(f'#### Creating POPSIM inputs for {len(self.STATES)} States: ####\n{self.STATES}')
         # Check which fiels need updating        
@@ -72,6 +85,12 @@ class CreateInputData:
             print('Crosswalk already exists. Skipping...')
             self.skip_xwalk = True
         
+        # Load only the batch's states from the cache
+        if not (self.skip_acs and self.skip_xwalk):
+            self.ACS_DATA = fetch.load_cache('ACS', self.FIPS, self.YEAR, self.ACS_TYPE)
+        if not (self.skip_pums and self.skip_xwalk):
+            self.PUMS_DATA = fetch.load_cache('PUMS', self.FIPS, self.YEAR, self.ACS_TYPE)
+        
         if not self.skip_pums:
             self.create_seeds()
             
@@ -88,36 +107,44 @@ class CreateInputData:
         
         # Select the states
         fips_int = [int(x) for x in self.FIPS]
-        pums_select = {geo: df[df.ST.isin(fips_int)].copy() for geo, df in self.PUMS_DATA.items()}   
+        pums_select = {geo: df[df.ST.isin(fips_int)] for geo, df in self.PUMS_DATA.items()}   
         
-        # Join together to ensure that the same households are selected
-        print('Joining HH and PER PUMS data for aggregation...')
-        pums = pd.merge(pums_select['HH'], pums_select['PER'], on=['SERIALNO', 'ST', 'PUMA'])
-
         # Concatenate state and PUMA to create a unique PUMA identifier
-        pums.rename(columns={'ST': 'STATE'}, inplace=True)
-        pums = utils.format_geoids(pums, verbose=self.verbose)
-        pums['REGION'] = 1
-        
-        # Create a new unique integer household_id column
+        pums_hh, pums_per = [
+            utils.format_geoids(pums_select[level].rename(columns={'ST': 'STATE'}), verbose=self.verbose) for level in ['HH', 'PER']
+        ]
+        
+        # Look up each person's household row by SERIALNO, rather than joining the household columns onto persons
+        print('Matching PER to HH PUMS data by SERIALNO...')
+        assert pums_hh.SERIALNO.is_unique, 'SERIALNO is not unique for HH!'
+        hh_rows = pd.Index(pums_hh.SERIALNO).get_indexer(pums_per.SERIALNO)
+        
+        # Keep only households with persons and persons with a household, as an inner join would
+        has_hh = hh_rows >= 0
+        has_per = np.bincount(hh_rows[has_hh], minlength=len(pums_hh)) > 0
+        pums_hh = pums_hh[has_per]
+        hh_rows = (np.cumsum(has_per) - 1)[hh_rows[has_hh]]
+        
+        # Persons in household order, as the join returned them
+        order = np.argsort(hh_rows, kind='stable')
+        pums_per = pums_per[has_hh].iloc[order]
+        hh_rows = hh_rows[order]
+        
+        # Create a new unique integer household_id column, numbered in SERIALNO order
         print('Creating household_id column...')
-        pums['hh_id'] = pums.groupby(['SERIALNO', 'PUMA']).ngroup() + 1
-        pums['hh_id'] = pums.PUMA.astype('int64') * (10 ** 8) + pums['hh_id']
-            
-        # Separate the household and person dataframes back out
-        print('Separating HH and PER PUMS data...')
-        percols = list(settings.PUMS_FIELDS['PER'].keys()) + ['REGION', 'STATE']
-        hhcols = list(settings.PUMS_FIELDS['HH'].keys()) + ['hh_id', 'REGION', 'STATE']
-        hhcols.remove('ST')
-        percols.remove('ST')
-        pums_hh = pums[hhcols].groupby('hh_id').first()
-        pums_per = pums.set_index('hh_id')[percols]
+        serial_rank = pd.factorize(pums_hh.SERIALNO, sort=True)[0] + 1
+        hh_id = pums_hh.PUMA.to_numpy(dtype=np.int64) * (10 ** 8) + serial_rank
 
         # Add num adults
         print('Calculating number of adults to households...')
-        pums_hh = pums_hh.join(pums_per[pums_per.AGEP >= 18].groupby('hh_id').size().to_frame('NP_ADULTS'))
-        pums_hh.NP_ADULTS.fillna(0, inplace=True)
-        pums_hh.NP_ADULTS = pums_hh.NP_ADULTS.astype(int)    
+        np_adults = np.bincount(hh_rows[pums_per.AGEP.to_numpy() >= 18], minlength=len(pums_hh))
+        
+        # Index both tables by household_id
+        percols = [x for x in settings.PUMS_FIELDS['PER'].keys() if x != 'ST'] + ['REGION', 'STATE']
+        hhcols = [x for x in settings.PUMS_FIELDS['HH'].keys() if x != 'ST'] + ['REGION', 'STATE', 'NP_ADULTS']
+        pums_hh = pums_hh.assign(REGION=1, NP_ADULTS=np_adults).set_index(pd.Index(hh_id, name='hh_id'))[hhcols].sort_index()
+        pums_per = pums_per.assign(REGION=1).set_index(pd.Index(hh_id[hh_rows], name='hh_id'))[percols]
+        pums_hh, pums_per = [utils.cast_dtypes(df, settings.SEED_DTYPES) for df in [pums_hh, pums_per]]
         
         # Assert that index is consistent
         assert len(pums_hh) == pums_hh.index.nunique(), 'Index is not unique for HH!'
@@ -125,7 +152,11 @@ class CreateInputData:
         self.PUMS_DATA_FINAL['HH'] = pums_hh
         self.PUMS_DATA_FINAL['PER'] = pums_per
         
-        self.check_seeds(pums_hh, pums_per)
+        # Evaluate the controls.csv expressions once, for the checks and later validation
+        print('Evaluating control expressions...')
+        self.INCIDENCE = controls.incidence_matrix({'households': pums_hh, 'persons': pums_per})
+        
+        self.check_seeds(pums_hh, pums_per, self.INCIDENCE)
         
         return
 
@@ -133,7 +164,8 @@ class CreateInputData:
         print('#### Creating ACS targets... ####')
             
         # Select the states
-        acs_data_select = {geo: df[df.state.isin(self.FIPS)].copy() for geo, df in self.ACS_DATA.items()}
+        fips_int = [int(x) for x in self.FIPS]
+        acs_data_select = {geo: df[df.state.isin(fips_int)].copy() for geo, df in self.ACS_DATA.items()}
         
         # GEOID cols
         renames = [[a, b] for a, b in self.renames.items()]
@@ -180,14 +212,17 @@ class CreateInputData:
             assert all(rem_data > 0), f'Remainder {remainder_col} is negative!'
             
         
+        # Sums are upcast to int64, so the targets are cast back to the compact type
+        control_dtypes = {x: settings.ACS_DTYPE for x in settings.CONTROL_FIELDS}
+        
         # Prepate state totals
         self.ACS_DATA_FINAL['STATE'] = pd.DataFrame(state_totals)
         self.ACS_DATA_FINAL['STATE'].index.name = 'STATE'
-        self.ACS_DATA_FINAL['STATE'].reset_index(inplace=True)
+        self.ACS_DATA_FINAL['STATE'] = utils.cast_dtypes(self.ACS_DATA_FINAL['STATE'].reset_index(), control_dtypes)
         
         # Prepare regional totals
         self.ACS_DATA_FINAL['REGION'] = pd.DataFrame(region_totals, index=pd.Index([1], name='REGION'))
-        self.ACS_DATA_FINAL['REGION'].reset_index(inplace=True)
+        self.ACS_DATA_FINAL['REGION'] = utils.cast_dtypes(self.ACS_DATA_FINAL['REGION'].reset_index(), control_dtypes)
             
         # Update GEOIDs and save results as targets        
         for geo, df in acs_data.items():
@@ -201,6 +236,7 @@ class CreateInputData:
             # Format GEOIDs        
             df = utils.format_geoids(df, verbose=self.verbose)
             df['REGION'] = 1
+            df = utils.cast_dtypes(df, control_dtypes)
             
             # Assert that index is consistent
             assert len(df.index) == df[geo].nunique(), f'Index is not unique for {geo}!'
@@ -249,27 +285,31 @@ class CreateInputData:
 
         return
     
-    def check_seeds(self, households: pd.DataFrame, persons: pd.DataFrame) -> None:
+    def check_seeds(self, households: pd.DataFrame, persons: pd.DataFrame, incidence: dict | None = None) -> None:
         """
         Check that the seed targets are consistent with the control groups.
         For example, that the sum of p_mode_... = p_total
         
+        Args:
+            households (pd.DataFrame): The household seeds.
+            persons (pd.DataFrame): The person seeds.
+            incidence (dict | None, optional): The seeds' incidence from controls.incidence_matrix, evaluated here if None.
+        
         Raises:
             AssertionError: If the seed targets are not consistent with the control groups.
         """
-
-        local_scope = locals()
-        global_scope = globals()
         
         assert isinstance(households, pd.DataFrame), 'Households is not a DataFrame!'
         assert isinstance(persons, pd.DataFrame), 'Persons is not a DataFrame!'
-                        
-        controls = settings.PUMS_AGGREGATOR.set_index('target')        
+        
+        if incidence is None:
+            incidence = controls.incidence_matrix({'households': households, 'persons': persons})
+        
         total_cols = {
             'households': settings.POPSIM_SETTINGS['total_hh_control'],
             'persons': settings.POPSIM_SETTINGS['total_per_control']
         }        
-        total_sums = {table: sum(eval(controls.loc[col].expression, global_scope, local_scope)) for table, col in total_cols.items()}     
+        total_sums = {table: incidence[table][col].sum() for table, col in total_cols.items()}     
 
         # Check that seed targets are consistent
         target_sums, group_sums = {}, {}
@@ -277,7 +317,7 @@ class CreateInputData:
         
         for table_name, seed_df in settings.PUMS_AGGREGATOR.groupby('seed_table'):
             for control_group, group_df in seed_df.groupby('control_group')[['target', 'expression']]:
-                targets = {target: sum(eval(expression, global_scope, local_scope)) for target, expression in group_df.itertuples(index=False)}
+                targets = incidence[table_name][group_df.target].sum().to_dict()
                 
                 target_sums.update(targets)
                 group_sums[control_group] = sum(targets.values())
@@ -297,75 +337,129 @@ class CreateInputData:
         
         return
             
-    def create_crosswalk(self):
+    def crosswalk_source(self) -> str:
+        """
+        Picks the crosswalk source. The relationship files map tracts of one decennial census to PUMAs of the
+        same census, so the spatial crosswalk is used when the ACS tracts and PUMS PUMAs are of different vintages.
+
+        Returns:
+            str: 'relationship' or 'spatial'.
+        """
+        assert settings.XWALK_SOURCE in ['relationship', 'spatial'], f'Unknown XWALK_SOURCE {settings.XWALK_SOURCE}!'
         
-        print('#### Creating crosswalk... ####')
+        if settings.XWALK_SOURCE == 'relationship':
+            tract_vintage = geographies.tract_vintage(self.YEAR)
+            puma_vintage = geographies.puma_vintage(self.YEAR)
+            if tract_vintage == puma_vintage:
+                return 'relationship'
+            print(f'{self.YEAR} ACS uses {tract_vintage} tracts but {puma_vintage} PUMAs, falling back to the spatial crosswalk...')
+        
+        return 'spatial'
+
+    def relationship_crosswalk(self) -> pd.DataFrame:
+        """
+        Builds the BG crosswalk from the Census tract to PUMA relationship file, without any geometry.
+        The block groups are those in the ACS BG data, and each gets the PUMA its tract nests in.
 
+        Returns:
+            pd.DataFrame: The formatted BG crosswalk.
+        """
         fips_int = [int(x) for x in self.FIPS]
+        vintage = geographies.puma_vintage(self.YEAR)
+        print(f'Joining block groups to PUMAs with the {vintage} tract to PUMA relationship file...')
         
-        # Select the states
-        puma_select = self.GEO_PUMA[self.GEO_PUMA.STATEFP.isin(self.FIPS)]
-        bg_select = self.GEO_BG[self.GEO_BG.STATEFP.isin(self.FIPS)]
-        tract_select = self.GEO_TRACT[self.GEO_TRACT.STATEFP.isin(self.FIPS)]            
+        names = {
+            'STATEFP': 'STATE',
+            'COUNTYFP': 'COUNTY',
+            'TRACTCE': 'TRACT',
+            'PUMA5CE': 'PUMA',
+        }
+        rel = geographies.fetch_relationship(vintage).rename(columns=names)
+        rel = rel[rel.STATE.isin(fips_int)]
+        
+        bg = self.ACS_DATA['BG']
+        bg = bg.loc[bg.state.isin(fips_int), ['state', 'county', 'tract', 'block group']].drop_duplicates()
+        bg = bg.rename(columns={'state': 'STATE', 'county': 'COUNTY', 'tract': 'TRACT', 'block group': 'BG'}).astype(np.int64)
+        
+        xwalk = bg.merge(rel, on=['STATE', 'COUNTY', 'TRACT'], how='inner')
+        print(f'Dropping {bg.shape[0] - xwalk.shape[0]} BG with a tract missing from the relationship file...')
+        
+        # Same columns as the spatial crosswalk
+        xwalk['BLKGRPCE'] = xwalk.BG.astype(str)
+        xwalk['NAMELSAD'] = 'Block Group ' + xwalk.BLKGRPCE
+        xwalk['REGION'] = 1
+        xwalk = xwalk[['BG', 'STATE', 'COUNTY', 'TRACT', 'BLKGRPCE', 'NAMELSAD', 'PUMA', 'REGION']]
+        
+        return utils.format_geoids(xwalk, verbose=self.verbose)
+
+    def spatial_crosswalk(self, fips_code: str) -> pd.DataFrame:
+        """
+        Builds a state's BG crosswalk by joining the BG and tract centroids to the PUMA polygons.
+        The PUMA nearest to each BG and tract centroid is kept too, so zones with several PUMAs
+        can be de-duped without the geometries.
+
+        Args:
+            fips_code (str): The state FIPS code.
+
+        Returns:
+            pd.DataFrame: The formatted BG crosswalk, with the NEAREST_PUMA_BG and NEAREST_PUMA_TRACT
+                and their distances in metres, NEAREST_PUMA_BG_METERS and NEAREST_PUMA_TRACT_METERS.
+        """
+        # Block groups and tracts are only needed as centroid points
+        puma_select = geographies.read_geography('PUMA', [fips_code], self.TIGER_VINTAGE)
+        bg_select = geographies.read_geography('BG', [fips_code], self.TIGER_VINTAGE, geometry='centroid')
+        tract_select = geographies.read_geography('TRACT', [fips_code], self.TIGER_VINTAGE, geometry='centroid')
         
         assert isinstance(puma_select, gpd.GeoDataFrame), 'PUMA data is not a GeoDataFrame!'
         assert isinstance(bg_select, gpd.GeoDataFrame), 'BG data is not a GeoDataFrame!'
         assert isinstance(tract_select, gpd.GeoDataFrame), 'Tract data is not a GeoDataFrame!'
-        
-        # Local copy to avoid corrupting original data
-        puma_select = puma_select.copy()
-        bg_select = bg_select.copy()
-        tract_select = tract_select.copy()
             
-        # Perform a spatial join on the PUMA and BG geometries to create a xwalk
+        # Perform a spatial join on the PUMA polygons and the BG/tract centroids to create a xwalk
         geoms = {
             'puma': puma_select.set_index('GEOID'),
-            'tract': tract_select.set_index('GEOID'),
-            'bg': bg_select.set_index('GEOID')[['STATEFP', 'COUNTYFP', 'TRACTCE', 'BLKGRPCE', 'NAMELSAD', 'geometry']],
         }
-
-        assert geoms['bg'].crs == geoms['tract'].crs == geoms['puma'].crs, 'CRS do not match!'
         
-        # Using centroids to perform spatial join because it is faster and avoids ambiguous intersections
-        print('Extracting centroids...')
+        # Using centroids to perform spatial join because it is faster and avoids ambiguous intersections.
+        # They are precomputed in the geography cache, so only the points are loaded.
         centroids = {
-            'bg': geoms['bg'].copy(),
-            'tract': geoms['tract'].copy(),
-            'puma': geoms['puma'].copy(),
-        }        
-        for k, v in centroids.items():
-            centroids[k].geometry = v.geometry.to_crs('+proj=cea').centroid.to_crs(geoms[k].crs)
+            'bg': bg_select.set_index('GEOID')[['STATEFP', 'COUNTYFP', 'TRACTCE', 'BLKGRPCE', 'NAMELSAD', 'geometry']],
+            'tract': tract_select.set_index('GEOID')[['STATEFP', 'COUNTYFP', 'TRACTCE', 'geometry']],
+        }
+
+        assert centroids['bg'].crs == centroids['tract'].crs == geoms['puma'].crs, 'CRS do not match!'
                     
         # Spatial join
         print('Performing spatial join on centroids...')                
         xwalks = {}
         for k, v in centroids.items():
-            if k.lower() == 'puma':
-                continue
             print(f'Performing spatial join with PUMAs on {k} centroids...')
             xwalks[k] = gpd.sjoin(v, geoms['puma'][['geometry']], how='left', predicate='within')        
         
+        # PUMA polygons projected to each state's UTM zone, with their spatial index built once for the nearest queries
+        puma_trees = geographies.state_trees(geoms['puma'])
+        
         # Find any unmatched block groups and joint by distance, if possible
         for geo, xwalk in xwalks.items():
-            points = centroids[geo]
-            xwalk = xwalks[geo]
-            orphans = points[xwalk.index_right.isna().values]
+            orphans = xwalk[xwalk.index_right.isna().values]
             print(f'Found {orphans.shape[0]} any unmatched {geo} and joining by distance (<1km)...')
-            for row in orphans.itertuples():
-                # Find the nearest PUMA within the state
-                state_pumas = geoms['puma'].loc[geoms['puma'].STATEFP == row.STATEFP]
-                distances = row.geometry.distance(state_pumas.geometry)
-                nearest = distances.idxmin()
-                
-                # Approximate degrees to meters conversion
-                if distances[nearest]*ARC_METERS < 1000:
-                    print(f'Found a PUMA within {distances[nearest]*ARC_METERS}m for {geo} {row.Index}! Joining...')
-                    xwalk.loc[row.Index, 'index_right'] = nearest
-                else:
-                    print(f'Could not find a PUMA within 1km for {geo} {row.Index}! Dropping...')
-                    xwalk.drop(row.Index, inplace=True)
+            if orphans.shape[0] == 0:
+                continue
+            
+            # Find the nearest PUMA within the state
+            nearest = geographies.nearest_polygons(orphans, puma_trees, max_distance=NEAREST_MAX_METERS)
+            found = (nearest.distance < NEAREST_MAX_METERS).values
+            print(f'Found a PUMA within 1km for {found.sum()} {geo}, dropping {(~found).sum()}...')
             
-            xwalks[geo] = xwalk
+            xwalk.loc[orphans.index[found], 'index_right'] = nearest.nearest.values[found]
+            xwalks[geo] = xwalk.drop(orphans.index[~found])
+        
+        # Nearest PUMA to every centroid however far, and its distance, for de-duping zones with several PUMAs
+        xwalk = xwalks['bg']
+        for geo, points in centroids.items():
+            nearest = geographies.nearest_polygons(points, puma_trees)
+            zone_ids = xwalk.index.str[:sum(settings.GEOID_LEN[x] for x in settings.GEOID_STRUCTURE[geo.upper()])]
+            xwalk[f'NEAREST_PUMA_{geo.upper()}'] = zone_ids.map(pd.to_numeric(nearest.nearest))
+            xwalk[f'NEAREST_PUMA_{geo.upper()}_METERS'] = zone_ids.map(nearest.distance)
         
         names = {
             'index_right': 'PUMA',
@@ -374,17 +468,64 @@ class CreateInputData:
             'COUNTYFP': 'COUNTY', 
             'TRACTCE': 'TRACT'
         }
-        # Format columns
-        for geo, df in xwalks.items():            
-            xwalk = df.reset_index(inplace=False)
-            xwalk['REGION'] = 1
-            xwalk.drop(columns=['geometry'], inplace=True)
-            xwalk.rename(columns=names, inplace=True)  
-            xwalks[geo] = utils.format_geoids(xwalk, verbose=self.verbose)
+        # Format columns, using BG as the final crosswalk
+        xwalk = xwalk.reset_index(inplace=False)
+        xwalk['REGION'] = 1
+        xwalk.drop(columns=['geometry'], inplace=True)
+        xwalk.rename(columns=names, inplace=True)
         
+        return utils.format_geoids(pd.DataFrame(xwalk), verbose=self.verbose)
+
+    def spatial_crosswalk_key(self, fips_code: str, manifest: dict | None = None) -> str:
+        """
+        Returns the key of a state's spatial crosswalk, a SHA-256 digest of the PUMA, TRACT and BG partitions
+        it is joined from and the crosswalk parameters.
+
+        Args:
+            fips_code (str): The state FIPS code.
+            manifest (dict | None, optional): The cache manifest. Defaults to reading it.
+
+        Returns:
+            str: The SHA-256 hex digest.
+        """
+        sources = {geo: geographies.partition_hash(geo, fips_code, self.TIGER_VINTAGE, manifest) for geo in ['PUMA', 'TRACT', 'BG']}
+        params = {'version': XWALK_VERSION, 'nearest_max_meters': NEAREST_MAX_METERS, 'centroid_crs': geographies.CENTROID_CRS}
+
+        return hashlib.sha256(json.dumps({'sources': sources, **params}, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def load_spatial_crosswalk(self) -> pd.DataFrame:
+        """
+        Loads the batch's spatial crosswalk from the per-state cache of the TIGER vintage, building any missing states.
+        The crosswalk of a state does not depend on the batch, so each state is only joined once per vintage.
+        A cached state is rebuilt when its key no longer matches its source partitions or parameters.
+
+        Returns:
+            pd.DataFrame: The formatted BG crosswalk of the batch's states.
+        """
+        cached = geographies.cached_states('XWALK', self.TIGER_VINTAGE)
+        manifest = cache.read_manifest()
+        for fips_code in self.FIPS:
+            key = self.spatial_crosswalk_key(fips_code, manifest)
+            if fips_code in cached and geographies.partition_key('XWALK', fips_code, self.TIGER_VINTAGE) == key:
+                continue
+
+            status = 'Rebuilding stale' if fips_code in cached else 'Building'
+            print(f'{status} {self.TIGER_VINTAGE} spatial crosswalk for state {fips_code}...')
+            xwalk = self.spatial_crosswalk(fips_code)
+            geographies.write_partition(xwalk, 'XWALK', fips_code, self.TIGER_VINTAGE, key=key)
         
-        # Use BG as the final crosswalk
-        xwalk_final = xwalks['bg']
+        return geographies.read_crosswalk(self.FIPS, self.TIGER_VINTAGE)
+
+    def create_crosswalk(self):
+        
+        print('#### Creating crosswalk... ####')
+
+        fips_int = [int(x) for x in self.FIPS]
+        
+        if self.XWALK_SOURCE == 'relationship':
+            xwalk_final = self.relationship_crosswalk()
+        else:
+            xwalk_final = self.load_spatial_crosswalk()
         
         # Cross-check that all BGs and Tracts have data
         _data = {**self.ACS_DATA, **{'PUMA': self.PUMS_DATA['HH']}}
@@ -397,12 +538,12 @@ class CreateInputData:
                     renamer[old_name] = self.renames[new_name]
             df = df.rename(columns=renamer)
             
+            # Grab just the relevant states data, before formatting
+            df = df[df.STATE.isin(fips_int)]
+            
             # Format geoids
             df = utils.format_geoids(df, verbose=self.verbose)      
             
-            # Grab just the relevant states data
-            df = df[df.STATE.isin(fips_int)]
-            
             # Find and remove any empty rows
             # sum_cols = list(set(df.columns) - set(xwalk_final.columns))            
             sum_cols = df.select_dtypes(include='number').columns
@@ -429,30 +570,21 @@ class CreateInputData:
             # If there are duplicates, choose the zone it is closest to.
             if dupes.shape[0] > 0:
                 print(f'Found {dupes.shape[0]} {geo} with multiple PUMAs! De-duping by distance...')
-                for zone_id in dupes.index:                                     
-                    zone = centroids[geo.lower()].loc[str(zone_id).zfill(11)]
-                    
-                    # Make sure it's matching within the same State at least!
-                    puma_geoms = geoms['puma'][geoms['puma'].STATEFP == zone.STATEFP].geometry
-                    
-                    # Find distances and nearest puma
-                    distances = zone.geometry.distance(puma_geoms)
-                    nearest_puma = distances.idxmin()
-                    nearest_state = geoms['puma'].loc[nearest_puma].STATEFP
-                    
-                    assert zone.STATEFP == nearest_state, 'Nearest PUMA is not in the same state!'                    
-
-                    # Approximate degrees to meters conversion
-                    if distances[nearest_puma]*ARC_METERS < 1000:
-                        print(f'Found a PUMA within {distances[nearest_puma]*ARC_METERS}m for {geo} {zone_id}! Setting to PUMA {nearest_puma}...')
-                        xwalk_final.loc[(xwalk_final[geo] == zone_id)]
-                        xwalk_final.loc[(xwalk_final[geo] == zone_id), 'PUMA'] = int(nearest_puma)
-                    else:
-                        print(f'Could not find a PUMA within 1km for {zone_id}! Dropping...')
-                        drop_idx = xwalk_final.loc[(xwalk_final[geo] == zone_id) & (xwalk_final.PUMA != nearest_puma)].index
-                        xwalk_final.drop(drop_idx, inplace=True)
-        
-        self.XWALK_FINAL = xwalk_final
+                assert self.XWALK_SOURCE == 'spatial', 'Tracts nest within PUMAs, the relationship crosswalk cannot have duplicates!'
+                
+                # Nearest PUMA within the same state, precomputed in the spatial crosswalk
+                is_dupe = xwalk_final[geo].isin(dupes.index)
+                zone_puma = xwalk_final[f'NEAREST_PUMA_{geo}']
+                within = is_dupe & (xwalk_final[f'NEAREST_PUMA_{geo}_METERS'] < NEAREST_MAX_METERS)
+                print(f'Found a PUMA within 1km for {xwalk_final.loc[within, geo].nunique()} {geo}, '
+                      f'keeping only the nearest PUMA for {xwalk_final.loc[is_dupe & ~within, geo].nunique()}...')
+                
+                # Set the zones within 1km to their nearest PUMA, the others keep only their rows in the nearest PUMA
+                xwalk_final = xwalk_final[~(is_dupe & ~within) | (xwalk_final.PUMA == zone_puma)].copy()
+                within = within[xwalk_final.index]
+                xwalk_final.loc[within, 'PUMA'] = xwalk_final.loc[within, f'NEAREST_PUMA_{geo}'].astype(np.int64)
+        
+        self.XWALK_FINAL = xwalk_final.drop(columns=[x for x in xwalk_final.columns if x.startswith('NEAREST_PUMA_')])
         
         return
 
@@ -462,6 +594,13 @@ class CreateInputData:
             for level, path in self.PUMS_DATA_PATHS.items():
                 print(f'Saving {level} PUMS data...')
                 self.PUMS_DATA_FINAL[level].to_csv(path, index=True)
+            
+            # Keyed by the seed files as written, so run_populationsim.py only uses it for these seeds and controls
+            if len(self.INCIDENCE) > 0:
+                print('Saving seed incidence table...')
+                incidence_table = controls.household_incidence(self.INCIDENCE, self.PUMS_DATA_FINAL['HH'].index)
+                key = incidence.incidence_key(self.PUMS_DATA_PATHS.values(), os.path.join(settings.POPSIM_DIR, 'configs/controls.csv'))
+                incidence.write_incidence(incidence_table, self.INCIDENCE_PATH, key)
 
         if len(self.ACS_DATA_FINAL) > 0 and not self.skip_acs:
             for geo, path in self.ACS_DATA_PATHS.items():
@@ -2,6 +2,7 @@ import os
 #os.environ['DC_STATEHOOD'] = '1'
 from pathlib import Path
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
 from us import states
 import yaml
@@ -23,44 +24,49 @@ RAW_DATA_DIR = os.path.join(SETUP_DIR, 'raw')
 STATES = ["AL"]
 # STATES = [x.abbr for x in states.STATES]
 ACS_TYPE = 'acs5'
+TIGER_VINTAGE = None  # TIGER/Line boundary year, None to use YEAR
 BATCH_SIZE = 1
 
 """
 You must define the PUMS fields you want to use for households and persons,
 grouped in a nested dictionary by table. The fields must also specify the data
 type (int, float, str, etc.) to ensure that the data is read in correctly.
+Use the smallest numpy type that fits, fields with missing values are filled
+with 995 and so need np.int16 or larger.
+PUMA and ST are int64, as they are combined into the GEOID keys, see utils.format_geoids.
+SERIALNO is read as str and stored as an int64 key, see utils.encode_serialno.
 """
 PUMS_FIELDS = {
     'HH': {
         'SERIALNO': str,
-        'PUMA': int,
-        'ST': int,
-        'WGTP':int, 
-        'NP': int,
-        'HINCP': int, 
-        'VEH': int,
-        'HUPAC': int,
-        'TEN': int,
-        'MRGP': int,
-        'SMOCP': int,
-        'RNTP': int,
-        'GRNTP': int,
+        'PUMA': np.int64,
+        'ST': np.int64,
+        'WGTP': np.int32,
+        'NP': np.int8,
+        'HINCP': np.int32,
+        'VEH': np.int16,
+        'HUPAC': np.int16,
+        'TEN': np.int16,
+        'MRGP': np.int32,
+        'SMOCP': np.int32,
+        'RNTP': np.int32,
+        'GRNTP': np.int32,
     },
     'PER': {
         'SERIALNO': str,
-        'SPORDER': int,
-        'PUMA': int,
-        'ST': int,
-        'PWGTP': int,
-        'JWTRNS': int,        
-        'ESR': int,        
-        'SCH': int,
-        'SCHG': int,
-        'AGEP': int,
-        'SEX': int,
-        'RAC1P': int,
-        'HISP': int,
-        'WKHP': int,
+        'SPORDER': np.int8,
+        'PUMA': np.int64,
+        'ST': np.int64,
+        'PWGTP': np.int32,
+        'JWTRNS': np.int16,
+        'ESR': np.int16,
+        'SCH': np.int16,
+        'SCHG': np.int16,
+        'AGEP': np.int8,
+        'SEX': np.int8,
+        'RAC1P': np.int8,
+        'HISP': np.int8,
+        'WKHP': np.int16,
     }
 }
 
@@ -83,14 +89,59 @@ ACS_REMAINDERS = {
             'GEOGRAPHY': 'BG',
             'ADD_COLS': 'P_TOTAL',
             'SUBTRACT_COLS': ['P_FULL_TIME', 'P_PART_TIME']
-        },  
+        },
+}
+
+# Census servers, set CENSUS_API_URL/CENSUS_FTP_URL in the environment to use a local census_server
+CENSUS_API_URL = os.getenv('CENSUS_API_URL', 'https://api.census.gov')
+CENSUS_FTP_URL = os.getenv('CENSUS_FTP_URL', 'https://www2.census.gov')
+
+# Census API fetch engine
+API_MAX_WORKERS = 8     # Maximum number of concurrent in-flight Census API requests
+API_RATE_LIMIT = 10     # Sustained request rate (requests per second)
+API_BURST = 10          # Maximum burst of requests above the sustained rate
+API_MAX_RETRIES = 5     # Number of retries when the server throttles requests
+API_BACKOFF = 2         # Base backoff in seconds when throttled, doubled on each retry
+API_MAX_FIELDS = 50     # Census API limit on variables per request, including NAME
+API_MAX_URL_LENGTH = 4000  # Longest request URL to send, fields are split over more requests beyond this
+API_MAX_STATES = 10     # Most states grouped into one ACS request's state: clause, PUMS is fetched one state at a time
+API_TARGET_LATENCY = 10  # Request seconds to aim for, request sizes shrink above and grow below this
+
+# Shared HTTP client
+HTTP_RETRIES = 10       # Retries on connection errors and 429/5xx responses
+HTTP_BACKOFF = 0.1      # urllib3 backoff factor between retries
+HTTP_TIMEOUT = (30, 300)  # Connect and read timeouts in seconds
+DOWNLOAD_ATTEMPTS = 5   # Attempts to resume an interrupted file download
+PUMS_CSV_BLOCK_SIZE = 32 * 1024 ** 2  # Bytes of PUMS CSV parsed per streamed record batch
+HTTP_CACHE_TTL = 24 * 3600      # Seconds a cached directory listing is used before revalidating, None to disable
+API_CACHE_TTL = 30 * 24 * 3600  # Seconds a cached Census API response is used before revalidating, None to disable
+HTTP_POOL_SIZE = {      # Keep-alive connections kept open per host
+    CENSUS_API_URL: API_MAX_WORKERS,
+    CENSUS_FTP_URL: 4,
 }
 
+# Crosswalk source, 'relationship' for the Census tract to PUMA relationship files or 'spatial' to join TIGER geometries.
+# 'relationship' falls back to 'spatial' when the ACS tracts and the PUMS PUMAs are from different censuses (2020-2021).
+XWALK_SOURCE = 'relationship'
+
+# Per-state PUMS and TIGER processing
+PROCESS_WORKERS = None          # Worker processes, None for one per core (see utils.worker_count), 1 to run serially
+PROCESS_WORKER_MEMORY_GB = 2    # Approximate peak memory per worker, caps workers to the available memory
+
+# Compact data types, see also PUMS_FIELDS
+ACS_DTYPE = np.int32    # ACS estimates and targets, signed for the negative annotation values, e.g., -666666666
+SEED_DTYPES = {'NP_ADULTS': np.int8, 'REGION': np.int8}  # Columns added to the seeds
+DTYPE_CHECK = True      # Assert that values fit their data type when casting, rather than wrapping around silently
+
+# Raw cache budget, check usage with python -m setup_inputs.cache status
+RAW_CACHE_BUDGET_BYTES = 50 * 1024 ** 3  # Size above which ingested zips and cached HTTP responses are evicted, least recently used first, None to keep all
+
 # -------------------_DO NOT EDIT BELOW THIS LINE_------------------- #
 # Inferred constants
 CENSUS_API_KEY = os.getenv('CENSUS_API_KEY')
 STATES = STATES if isinstance(STATES, list) else [STATES]
 FIPS = [getattr(states.lookup(x), 'fips') for x in STATES] 
+TIGER_VINTAGE = YEAR if TIGER_VINTAGE is None else TIGER_VINTAGE
 
 ACS_AGGREGATOR = pd.read_csv(os.path.join(POPSIM_DIR, 'configs/controls_aggregator.csv'))
 PUMS_AGGREGATOR = pd.read_csv(os.path.join(POPSIM_DIR, 'configs/controls.csv'))
@@ -98,6 +149,7 @@ PUMS_AGGREGATOR = pd.read_csv(os.path.join(POPSIM_DIR, 'configs/controls.csv'))
 # Extract fields from aggregators
 ACS_AGGREGATION, ACS_GEO_FIELDS, CONTROL_FIELDS, ACS_TABLES = aggregate_acs_fields(ACS_AGGREGATOR)
 CONTROL_FIELDS.extend(ACS_REMAINDERS.keys())
+ACS_GEO_FIELDS = {geo: {k: ACS_DTYPE if v in ['int', int] else v for k, v in fields.items()} for geo, fields in ACS_GEO_FIELDS.items()}
 
 # Control fields must match!
 assert set(CONTROL_FIELDS) == set(PUMS_AGGREGATOR.control_field.to_list()),\
@@ -107,7 +159,12 @@ assert set(CONTROL_FIELDS) == set(PUMS_AGGREGATOR.control_field.to_list()),\
 ACS_DATA_PREFIX = 'acs_data'
 PUMS_DATA_PREFIX = 'pums_data'
 PUMS_SOURCE = 'ftp'
+ACS_PERIODS = {'acs1': '1-Year', 'acs5': '5-Year'} # PUMS FTP folder for each ACS type
 CHECKSUM_TOLERANCE = 0.01 # 1% tolerance for checksums
+XWALK_RELATIONSHIP_FILES = { # Tract to PUMA relationship files under CENSUS_FTP_URL, by decennial census
+    2010: 'geo/docs/maps-data/data/rel/2010_Census_Tract_to_2010_PUMA.txt',
+    2020: 'geo/docs/maps-data/data/rel2020/2020_Census_Tract_to_2020_PUMA.txt',
+}
 
 # Read popsim yaml
 with open(os.path.join(POPSIM_DIR, 'configs/settings.yaml')) as f:
@@ -1,12 +1,20 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 import requests
 from requests.adapters import HTTPAdapter, Retry
 import json
+import re
 from tqdm import tqdm
 from itertools import islice
 from bs4 import BeautifulSoup
 import os
+import time
+import threading
+import hashlib
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 #os.environ['DC_STATEHOOD'] = '1'
 import us
 
@@ -72,43 +80,735 @@ def format_geoids(target_df: pd.DataFrame, verbose: bool = True) -> pd.DataFrame
     
     return target_df              
 
-def get_with_progress(url: str) -> bytes:
+SERIALNO_KINDS = ['GQ', 'HU']  # Record types of the PUMS SERIALNO, their position is the record type digit of the encoded key
+
+def encode_serialno(serialno: pd.Series) -> pd.Series:
+    """
+    Encodes PUMS SERIALNO strings as int64 keys, splitting out the year and record type prefix,
+    e.g., 2021HU0012345 -> 2021 * 10^8 + 1 * 10^7 + 12345 = 202110012345.
+    The record type digit follows SERIALNO_KINDS, so the keys sort in the same order as the strings.
+    All-numeric SERIALNO, as used before 2017, are 13 digits and kept as they are. See decode_serialno.
+
+    Args:
+        serialno (pd.Series): The SERIALNO strings, integer Series are returned as int64.
+
+    Raises:
+        AssertionError: If a SERIALNO has an unknown record type.
+
+    Returns:
+        pd.Series: The int64 keys.
+    """
+    if pd.api.types.is_integer_dtype(serialno):
+        return serialno.astype(np.int64)
+    
+    values = pa.array(serialno.to_numpy(dtype=object), type=pa.string())
+    numeric = pc.utf8_is_digit(values).to_numpy(zero_copy_only=False)
+    encoded = np.empty(len(values), dtype=np.int64)
+    
+    if numeric.any():
+        encoded[numeric] = pc.cast(values.filter(numeric), pa.int64()).to_numpy()
+    
+    if not numeric.all():
+        coded = values.filter(~numeric)
+        kind = pc.index_in(pc.utf8_slice_codeunits(coded, 4, 6), value_set=pa.array(SERIALNO_KINDS))
+        assert kind.null_count == 0, f'Unexpected SERIALNO record types in {coded.filter(pc.is_null(kind))[:5].to_pylist()}'
+        year = pc.cast(pc.utf8_slice_codeunits(coded, 0, 4), pa.int64()).to_numpy()
+        number = pc.cast(pc.utf8_slice_codeunits(coded, 6, 13), pa.int64()).to_numpy()
+        encoded[~numeric] = year * 10 ** 8 + kind.to_numpy().astype(np.int64) * 10 ** 7 + number
+    
+    return pd.Series(encoded, index=serialno.index, name=serialno.name)
+
+def decode_serialno(keys: pd.Series) -> pd.Series:
+    """
+    Decodes int64 keys from encode_serialno back to the PUMS SERIALNO strings.
+
+    Args:
+        keys (pd.Series): The encoded keys.
+
+    Returns:
+        pd.Series: The SERIALNO strings.
+    """
+    keys = keys.astype(np.int64)
+    numeric = keys >= 10 ** 12
+    year, rest = np.divmod(keys, 10 ** 8)
+    kind, number = np.divmod(rest, 10 ** 7)
+    
+    kinds = pd.Series(np.array(SERIALNO_KINDS)[np.where(numeric, 0, kind)], index=keys.index)
+    decoded = year.astype(str) + kinds + number.astype(str).str.zfill(7)
+    
+    return decoded.where(~numeric, keys.astype(str))
+
+def encode_pums_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Encodes the SERIALNO column of a PUMS table as int64 keys, if not already, so joins and groupbys run on integers.
+
+    Args:
+        df (pd.DataFrame): The PUMS data.
+
+    Returns:
+        pd.DataFrame: The PUMS data with the encoded SERIALNO.
+    """
+    if 'SERIALNO' in df.columns and not pd.api.types.is_integer_dtype(df['SERIALNO']):
+        df = df.assign(SERIALNO=encode_serialno(df['SERIALNO']))
+    
+    return df
+
+def cast_dtypes(df: pd.DataFrame, dtypes: dict, check: bool | None = None) -> pd.DataFrame:
+    """
+    Casts columns to their data types, e.g., the compact integer types in settings.PUMS_FIELDS.
+    astype wraps integers that do not fit around silently, e.g., 995 to np.int8 gives -29,
+    so with the check the value range of each integer column is asserted first.
+
+    Args:
+        df (pd.DataFrame): The data.
+        dtypes (dict): The columns and their data types, columns not in the data are skipped.
+        check (bool | None, optional): Whether to check for overflow. Defaults to settings.DTYPE_CHECK.
+
+    Raises:
+        AssertionError: If the check is on and a column has values outside its data type's range.
+
+    Returns:
+        pd.DataFrame: The data with the columns cast.
+    """
+    check = settings.DTYPE_CHECK if check is None else check
+    dtypes = {k: v for k, v in dtypes.items() if k in df.columns}
+    
+    if check and len(df) > 0:
+        for col, dtype in dtypes.items():
+            if dtype in [str, 'str', object] or np.dtype(dtype).kind not in 'iu':
+                continue
+            values = pd.to_numeric(df[col]) if df[col].dtype.kind == 'O' else df[col]
+            info = np.iinfo(dtype)
+            low, high = values.min(), values.max()
+            assert not (low < info.min or high > info.max), f'{col} values {low} to {high} overflow {np.dtype(dtype).name}'
+    
+    return df.astype(dtypes)
+
+
+
+class ThrottledError(Exception):
+    """
+    Raised when the server responds that the client is being throttled (HTTP 429 or 503).
+    """
+    def __init__(self, url: str, status_code: int, retry_after: float | None = None) -> None:
+        self.url = url
+        self.status_code = status_code
+        self.retry_after = retry_after
+        super().__init__(f'{status_code} error: server is throttling requests to {url}')
+
+
+class StatusError(AssertionError):
+    """
+    Raised when the server responds with an error status code. An AssertionError, as the status check was before.
+    """
+    def __init__(self, url: str, status_code: int, text: str = '') -> None:
+        self.url = url
+        self.status_code = status_code
+        super().__init__(f'{status_code} error: {text}')
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter. Tokens are refilled at a constant rate up to the
+    bucket capacity and each request consumes one token, blocking until one is available.
+    """
+    def __init__(self, rate: float, capacity: int) -> None:
+        assert rate > 0, 'rate must be positive'
+        assert capacity >= 1, 'capacity must be at least one'
+        
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """
+        Blocks until a token is available, then consumes it.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            
+    def pause(self, seconds: float) -> None:
+        """
+        Pauses all callers for a number of seconds, e.g., when the server throttles requests.
+
+        Args:
+            seconds (float): The number of seconds to pause for.
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class AdaptiveSize:
+    """
+    Thread-safe request size controller. The size grows additively while requests come back
+    faster than the target latency and shrinks multiplicatively on slow or failed requests.
+    """
+    def __init__(self, initial: int, minimum: int, maximum: int, target_latency: float) -> None:
+        assert 1 <= minimum <= maximum, 'Expected 1 <= minimum <= maximum'
+        assert target_latency > 0, 'target_latency must be positive'
+        
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.size = min(max(initial, minimum), maximum)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+    
+    @property
+    def value(self) -> int:
+        with self.lock:
+            return self.size
+    
+    def record(self, latency: float | None, ok: bool = True) -> None:
+        """
+        Records the outcome of a request and adjusts the size.
+
+        Args:
+            latency (float | None): The request latency in seconds, None if it failed before responding.
+            ok (bool, optional): Whether the request succeeded. Defaults to True.
+        """
+        with self.lock:
+            self.requests += 1
+            if not ok:
+                self.errors += 1
+                self.size = max(self.minimum, self.size // 2)
+            elif latency > self.target_latency:
+                self.size = max(self.minimum, int(self.size * self.target_latency / latency))
+            elif latency < self.target_latency / 2:
+                self.size = min(self.maximum, self.size + max(1, self.size // 4))
+    
+    def error_rate(self) -> float:
+        """
+        Returns the share of recorded requests that failed.
+        """
+        with self.lock:
+            return self.errors / self.requests if self.requests > 0 else 0.0
+
+
+# Shared pooled HTTP client and its counters
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+HTTP_STATS = {'requests': 0, 'bytes': 0, 'retries': 0, 'latency': 0.0, 'cache_hits': 0, 'revalidated': 0}
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the module-level pooled HTTP session, creating it on first use. Connections are
+    kept alive and reused per host, and connection errors and 429/5xx responses are retried
+    with an exponential backoff.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _SESSION
+    
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            retries = Retry(total=settings.HTTP_RETRIES,
+                            backoff_factor=settings.HTTP_BACKOFF,
+                            status_forcelist=[429, 500, 502, 503, 504],
+                            respect_retry_after_header=True,
+                            raise_on_status=False)
+            
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(max_retries=retries))
+            session.mount('http://', HTTPAdapter(max_retries=retries))
+            # Longest prefix wins, so per-host adapters override the defaults above
+            for host, pool_size in settings.HTTP_POOL_SIZE.items():
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retries)
+                session.mount(host, adapter)
+            _SESSION = session
+            
+    return _SESSION
+
+def reset_session() -> None:
+    """
+    Closes the shared session, so the next request builds a new one from the current settings,
+    e.g., after the Census URLs and their HTTP_POOL_SIZE entries change.
+    """
+    global _SESSION
+    
+    with _SESSION_LOCK:
+        if _SESSION is not None:
+            _SESSION.close()
+        _SESSION = None
+
+def http_get(url: str, stream: bool = False, **kwargs) -> requests.Response:
+    """
+    Gets a URL using the shared pooled session and records the request counters.
+    Streamed response bytes must be counted by the caller with count_bytes().
+
+    Args:
+        url (str): The URL to get.
+        stream (bool, optional): Whether to stream the response body. Defaults to False.
+
+    Raises:
+        Exception: If the request could not be completed.
+
+    Returns:
+        requests.Response: The response.
+    """
+    
+    try:
+        response = get_session().get(url, stream=stream, timeout=settings.HTTP_TIMEOUT, **kwargs)
+    except requests.exceptions.RequestException as e:
+        raise Exception(f'Error fetching data from {url}, check your internet connection or maybe reduce the request size?') from e
+    
+    history = getattr(getattr(response.raw, 'retries', None), 'history', None) or ()
+    with _SESSION_LOCK:
+        HTTP_STATS['requests'] += 1
+        HTTP_STATS['retries'] += len(history)
+        HTTP_STATS['latency'] += response.elapsed.total_seconds()
+        if not stream:
+            HTTP_STATS['bytes'] += len(response.content)
+    
+    return response
+
+def count_bytes(n: int) -> None:
+    """
+    Adds streamed response bytes to the HTTP counters.
+
+    Args:
+        n (int): The number of bytes received.
+    """
+    with _SESSION_LOCK:
+        HTTP_STATS['bytes'] += n
+
+def http_stats() -> dict:
+    """
+    Returns a snapshot of the shared HTTP client counters.
+
+    Returns:
+        dict: Total requests, bytes, retries, latency (seconds), response cache hits and revalidations,
+            plus the mean latency per request.
+    """
+    with _SESSION_LOCK:
+        stats = dict(HTTP_STATS)
+    stats['mean_latency'] = stats['latency'] / stats['requests'] if stats['requests'] else 0.0
+    
+    return stats
+
+def response_cache_path(url: str) -> str:
+    """
+    Returns the response cache path for a URL, without the extension. The API key is not part of the cache key.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The cache file path, to which .body and .json are appended.
+    """
+    key = hashlib.sha256(strip_api_key(url).encode('utf-8')).hexdigest()
+    
+    return os.path.join(settings.RAW_DATA_DIR, 'http', key[:2], key)
+
+def strip_api_key(url: str) -> str:
+    """
+    Removes the Census API key from a URL, so it is not cached or logged.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The URL without the key parameter.
+    """
+    return re.sub(r'&key=[^&]*', '', url)
+
+def read_response_cache(url: str) -> tuple:
+    """
+    Reads a cached response for a URL.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        tuple: The response metadata dictionary and body bytes, or (None, None) if not cached.
+    """
+    path = response_cache_path(url)
+    try:
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        with open(path + '.body', 'rb') as f:
+            body = f.read()
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None, None
+    
+    return meta, body
+
+def write_response_cache(url: str, meta: dict, body: bytes | None = None) -> None:
+    """
+    Writes a response to the cache, replacing the files atomically.
+
+    Args:
+        url (str): The URL.
+        meta (dict): The response metadata (ETag, Last-Modified, Content-Type and fetch time).
+        body (bytes | None, optional): The response body, None to only update the metadata. Defaults to None.
+    """
+    path = response_cache_path(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    if body is not None:
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path + '.body')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, path + '.json')
+
+def cached_response(url: str, ttl: float | None, raw: bool = False) -> tuple:
+    """
+    Looks up the cached response for a URL once, without any network request.
+
+    Args:
+        url (str): The URL.
+        ttl (float | None): The time to live in seconds, None to disable the cache.
+        raw (bool, optional): Whether to return the raw bytes rather than parsing JSON responses. Defaults to False.
+
+    Returns:
+        tuple: The response if it was fetched within the TTL, else None, and the cached metadata and body
+            to revalidate with, (None, None) if not cached.
+    """
+    if ttl is None:
+        return None, None, None
+    
+    meta, body = read_response_cache(url)
+    if meta is None or time.time() - meta['fetched'] > ttl:
+        return None, meta, body
+    
+    with _SESSION_LOCK:
+        HTTP_STATS['cache_hits'] += 1
+    
+    return decode_response(body, meta.get('content_type', ''), raw), meta, body
+
+def decode_response(raw_data: bytes, content_type: str, raw: bool = False) -> bytes | list | dict:
+    """
+    Parses a JSON response body, other content is returned as is.
+
+    Args:
+        raw_data (bytes): The response body.
+        content_type (str): The response Content-Type header.
+        raw (bool, optional): Whether to return the raw bytes regardless. Defaults to False.
+
+    Returns:
+        bytes | list | dict: The parsed JSON or the raw bytes.
+    """
+    if not raw and 'utf-8' in content_type.lower():
+        return json.loads(raw_data.decode('utf-8'))
+    
+    return raw_data
+
+def get_with_progress(url: str, progress: bool = True, raw: bool = False, cache_ttl: float | None = None,
+                      cached: tuple | None = None) -> bytes:
     """
     This function gets data from a URL with a progress bar.
+    With a cache TTL, responses are kept in the on-disk response cache. Fresh entries are returned without
+    a request, and stale ones are revalidated with their ETag/Last-Modified so unchanged content is not re-sent.
 
     Args:
         url (str): The URL to get data from
+        progress (bool, optional): Whether to display a progress bar. Defaults to True.
+        raw (bool, optional): Whether to return the raw bytes rather than parsing JSON responses. Defaults to False.
+        cache_ttl (float | None, optional): Seconds a cached response is used without revalidation,
+            None to bypass the response cache. Defaults to None.
+        cached (tuple | None, optional): The cached_response lookup the caller already made for the URL,
+            so the cache is not read again. Defaults to looking it up here.
+
+    Raises:
+        ThrottledError: If the server still responds with a 429 or 503 status code after retrying.
 
     Returns:
         str: The data string from the URL
     """
+    
+    fresh, meta, body = cached_response(url, cache_ttl, raw) if cached is None else cached
+    if fresh is not None:
+        return fresh
+    
+    # Ask the server to only send the content if it changed since it was cached
+    headers = {}
+    if meta is not None and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta is not None and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
 
-    try:
-        s = requests.Session()
-        retries = Retry(total=10,
-                        backoff_factor=0.1,
-                        status_forcelist=[500, 502, 503, 504])
-
-        s.mount('https://', HTTPAdapter(max_retries=retries))
-        response = requests.get(url, stream=True)
-    except:
-        raise Exception(f'Error fetching data from {url}, check your internet connection or maybe reduce the request size?')
+    response = http_get(url, stream=True, headers=headers)
+    
+    if response.status_code == 304 and meta is not None:
+        response.close()
+        meta['fetched'] = time.time()
+        write_response_cache(url, meta)
+        with _SESSION_LOCK:
+            HTTP_STATS['revalidated'] += 1
+        return decode_response(body, meta.get('content_type', ''), raw)
+    
+    # Let the caller decide how to back off when throttled
+    if response.status_code in [429, 503]:
+        retry_after = response.headers.get('Retry-After', '')
+        raise ThrottledError(url, response.status_code, float(retry_after) if retry_after.isdigit() else None)
     
     # Check the response status code        
-    assert response.status_code == 200, f'{response.status_code} error: {response.text}'
+    if response.status_code != 200:
+        raise StatusError(url, response.status_code, response.text)
     
-    raw_data = b''        
+    # Collect the chunks and join once, rather than copying the growing bytes on every chunk
+    raw_chunks = []
     total = int(response.headers.get('Content-Length', 0))
-    with tqdm(total=total, unit='B', unit_scale=True, unit_divisor=1024) as pbar:            
-        for chunk in response.iter_content(1000000):
-            raw_data += chunk
-            pbar.update(len(chunk))
+    with tqdm(total=total, unit='B', unit_scale=True, unit_divisor=1024, disable=not progress) as pbar:            
+        try:
+            for chunk in response.iter_content(1000000):
+                raw_chunks.append(chunk)
+                count_bytes(len(chunk))
+                pbar.update(len(chunk))
+        except requests.exceptions.RequestException as e:
+            # Wrapped as in http_get, so a connection dropped mid-response is handled as a failed request
+            raise Exception(f'Error reading data from {url}, check your internet connection or maybe reduce the request size?') from e
+    raw_data = b''.join(raw_chunks)
+    
+    if cache_ttl is not None:
+        meta = {
+            'url': strip_api_key(url),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_type': response.headers.get('Content-Type', ''),
+            'fetched': time.time(),
+        }
+        write_response_cache(url, meta, raw_data)
             
     # The request was successful, so parse the JSON response
-    if 'utf-8' in response.headers.get('Content-Type', '').lower():
-        raw_data = json.loads(raw_data.decode('utf-8'))
+    return decode_response(raw_data, response.headers.get('Content-Type', ''), raw)
+
+def file_hash(fpath: str) -> str:
+    """
+    Computes the SHA-256 hex digest of a file, reading it in chunks.
+
+    Args:
+        fpath (str): The file path.
+
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    hasher = hashlib.sha256()
+    with open(fpath, 'rb') as f:
+        for block in iter(lambda: f.read(1000000), b''):
+            hasher.update(block)
+
+    return hasher.hexdigest()
+
+def download_file(url: str, fpath: str, sha256: str | None = None, progress: bool = True) -> str:
+    """
+    Streams a URL straight to a temporary file next to fpath, so memory stays flat regardless of
+    the file size. An interrupted transfer is resumed from the partial file with an HTTP Range request.
+    Once complete, the size and checksum are verified and the file is atomically renamed into place.
+
+    Args:
+        url (str): The URL to download.
+        fpath (str): The destination file path.
+        sha256 (str | None, optional): The expected SHA-256 hex digest, if known. Defaults to None.
+        progress (bool, optional): Whether to display a progress bar. Defaults to True.
+
+    Raises:
+        Exception: If the download is incomplete after retrying, or the file fails verification.
+
+    Returns:
+        str: The SHA-256 hex digest of the downloaded file.
+    """
     
-    return raw_data
+    part_path = fpath + '.part'
+    os.makedirs(os.path.dirname(fpath) or '.', exist_ok=True)
+    
+    for attempt in range(settings.DOWNLOAD_ATTEMPTS):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+        response = http_get(url, stream=True, headers=headers)
+        
+        # The range starts at or past the end of the file, so the partial file is usually already complete.
+        # The server reports the full size as Content-Range: bytes */<size>, without it only the checksum can tell.
+        if response.status_code == 416:
+            response.close()
+            size = response.headers.get('Content-Range', '').split('/')[-1].strip()
+            if (size.isdigit() and int(size) == offset) or (not size.isdigit() and sha256 is not None):
+                break
+            os.remove(part_path)
+            continue
+        
+        assert response.status_code in [200, 206], f'{response.status_code} error: {response.text}'
+        
+        # The server ignored the range request, so the full file is being sent again
+        if response.status_code == 200:
+            offset = 0
+            total = int(response.headers.get('Content-Length', 0))
+        else:
+            total = int(response.headers.get('Content-Range', '/0').split('/')[-1])
+        
+        try:
+            with open(part_path, 'ab' if offset > 0 else 'wb') as f, \
+                tqdm(total=total, initial=offset, unit='B', unit_scale=True, unit_divisor=1024, disable=not progress) as pbar:
+                for chunk in response.iter_content(1000000):
+                    f.write(chunk)
+                    count_bytes(len(chunk))
+                    pbar.update(len(chunk))
+        except requests.exceptions.RequestException as e:
+            print(f'Download of {url} interrupted ({e}), resuming...')
+            continue
+        
+        size = os.path.getsize(part_path)
+        if total == 0 or size == total:
+            break
+        print(f'Download of {url} incomplete, {size} of {total} bytes, resuming...')
+    else:
+        raise Exception(f'Could not download {url} after {settings.DOWNLOAD_ATTEMPTS} attempts, rerun to resume')
+    
+    # Checksum the complete file, as a resumed download was only partly seen here
+    digest = file_hash(part_path)
+    
+    if sha256 is not None and digest != sha256.lower():
+        os.remove(part_path)
+        raise Exception(f'Checksum mismatch for {url}, expected {sha256} got {digest}')
+    
+    if fpath.endswith('.zip') and not zipfile.is_zipfile(part_path):
+        os.remove(part_path)
+        raise Exception(f'Downloaded file from {url} is not a valid zip file')
+    
+    os.replace(part_path, fpath)
+    
+    return digest
+
+def available_memory() -> int | None:
+    """
+    Returns the available system memory in bytes, if it can be determined.
+
+    Returns:
+        int | None: The available memory in bytes, or None if unknown.
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    
+    # Linux fallback without psutil
+    if os.path.exists('/proc/meminfo'):
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    
+    return None
+
+def pid_alive(pid: int) -> bool:
+    """
+    Checks whether a process is running on this machine.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        bool: Whether the process is running.
+    """
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        pass
+    
+    # os.kill(pid, 0) would send CTRL_C_EVENT on Windows, so the process is opened instead
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == 259  # STILL_ACTIVE
+    
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    
+    return True
+
+def worker_count(n_tasks: int) -> int:
+    """
+    Returns the number of worker processes to use for a number of tasks, capped by
+    settings.PROCESS_WORKERS (or the core count) and by the available memory.
+
+    Args:
+        n_tasks (int): The number of tasks to run.
+
+    Returns:
+        int: The number of worker processes.
+    """
+    workers = settings.PROCESS_WORKERS or os.cpu_count() or 1
+    
+    memory = available_memory()
+    if memory is not None:
+        workers = min(workers, int(memory // (settings.PROCESS_WORKER_MEMORY_GB * 1024 ** 3)))
+    
+    return max(1, min(workers, n_tasks))
+
+def settings_values() -> dict:
+    """
+    Returns the current values of the settings constants, including any changed at runtime,
+    e.g., a script setting settings.YEAR or census_server.start_server setting the Census URLs.
+
+    Returns:
+        dict: The settings names and values.
+    """
+    return {k: v for k, v in vars(settings).items() if k.isupper()}
+
+def apply_settings(values: dict) -> None:
+    """
+    Sets the settings constants in a worker process. Spawned workers, as on Windows, import settings.py afresh
+    and so would otherwise see the values in the file rather than those of the parent process.
+
+    Args:
+        values (dict): The settings names and values from settings_values.
+    """
+    vars(settings).update(values)
+
+def run_in_processes(func, tasks: list) -> list:
+    """
+    Runs a function over a list of argument tuples in a process pool and returns the results in task order.
+    Runs serially in this process if only one worker is available. The workers get the parent's settings.
+
+    Args:
+        func (Callable): A module-level (picklable) function.
+        tasks (list): The list of argument tuples.
+
+    Returns:
+        list: The results, in the same order as the tasks.
+    """
+    workers = worker_count(len(tasks))
+    if workers <= 1:
+        return [func(*task) for task in tasks]
+    
+    print(f'Processing {len(tasks)} tasks with {workers} worker processes')
+    with ProcessPoolExecutor(max_workers=workers, initializer=apply_settings, initargs=(settings_values(),)) as executor:
+        futures = [executor.submit(func, *task) for task in tasks]
+        return [future.result() for future in futures]
 
 def batched(iterable, n):
     "Batch data into tuples of length n. The last batch may be shorter."
@@ -213,11 +913,11 @@ def parse_census_ftp(url: str, cache_dir: str, data_type: str) -> list:
         
         return fips, fpath, dlurl, level
 
-    # Connect to the FTP server
-    response = requests.get(url)
+    # Connect to the FTP server, the directory listing is kept in the response cache
+    listing = get_with_progress(url, progress=False, raw=True, cache_ttl=settings.HTTP_CACHE_TTL)
     
     # Get file URLs
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = BeautifulSoup(listing, 'html.parser')
     zips = [parse_soup(node) for node in soup.find_all('a') if check_soup(node)]
     
     return zips
\ No newline at end of file